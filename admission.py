@@ -0,0 +1,95 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional
+
+from metrics import Histogram
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class AdmissionController:
+    """Caps concurrent backend calls per worker behind a fair FIFO queue.
+
+    Callers beyond ``max_concurrency`` wait in arrival order; once
+    ``max_queue`` callers are waiting, new ones are rejected with
+    QueueFullError instead of piling more load onto the backend.
+    """
+
+    def __init__(self, max_concurrency: int = 16, max_queue: int = 64, position_interval: float = 1.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.position_interval = position_interval
+        self.active = 0
+        self.rejected = 0
+        self.wait_time = Histogram("aidw_backend_queue_wait_seconds", "Time spent waiting for a backend slot")
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    def _release(self) -> None:
+        # Hand the slot straight to the next live waiter so nobody can jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    async def _wait(self, waiter: asyncio.Future, on_position: Optional[PositionCallback]) -> None:
+        last_position = None
+        while True:
+            if on_position is not None:
+                position = self._waiters.index(waiter) + 1
+                if position != last_position:
+                    await on_position(position)
+                    last_position = position
+            done, _ = await asyncio.wait({waiter}, timeout=self.position_interval)
+            if done:
+                return
+
+    @asynccontextmanager
+    async def slot(self, on_position: Optional[PositionCallback] = None) -> AsyncIterator[None]:
+        started = time.monotonic()
+        queued = False
+        if self.active < self.max_concurrency and not self._waiters:
+            self.active += 1
+        else:
+            queued = True
+            if len(self._waiters) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError()
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await self._wait(waiter, on_position)
+            except BaseException:
+                if waiter.done() and not waiter.cancelled():
+                    # The slot was handed over just as we gave up; pass it on
+                    self._release()
+                else:
+                    waiter.cancel()
+                    try:
+                        self._waiters.remove(waiter)
+                    except ValueError:
+                        pass
+                raise
+
+        try:
+            self.wait_time.observe(time.monotonic() - started)
+            if queued and on_position is not None:
+                await on_position(0)
+            yield
+        finally:
+            self._release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "queued": sum(1 for w in self._waiters if not w.done()),
+            "rejected": self.rejected,
+            "wait_seconds": self.wait_time.snapshot(),
+        }
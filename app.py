@@ -1,32 +1,49 @@
-import urllib.request
+import urllib.parse
 import json
 import os
 import logging
 import asyncio
-from typing import Dict, Any, List, Optional
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, AsyncIterator, Callable, List, Optional, Tuple
 import chainlit as cl
+import httpx
+from opentelemetry import trace
 import re
-from datetime import datetime
 from dotenv import load_dotenv
 import base64
-from fastapi import FastAPI, Request
-from fastapi.responses import RedirectResponse, HTMLResponse
-import msal
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import RedirectResponse, HTMLResponse, PlainTextResponse
+from msal_client import MSALClient
+import random
 import secrets
+import functools
 import hashlib
+import io
+from collections import OrderedDict
+from chat_history import ChatHistory, Summarizer
+from admission import AdmissionController, PositionCallback, QueueFullError
+from circuit_breaker import CircuitBreaker
+from chainlit.session import ws_sessions_sid
+from log_pipeline import configure_logging, new_request_id, request_id_var
+from metrics import MetricsRegistry
+from tracing import setup_tracing, trace_headers, traced, tracer
+import oauth_providers
+from token_refresh import TokenRefresher, token_store
+from session_store import (
+    SESSION_COOKIE,
+    SessionSigner,
+    build_session_store,
+    cookie_from_header,
+    new_session_id,
+)
+from response_cache import ResponseCache, SQLiteCacheBackend
 
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler(f'chatbot_{datetime.now().strftime("%Y%m%d")}.log')
-    ]
-)
+# Configure logging; file writes happen off the event loop
+log_listener = configure_logging(logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Microsoft Azure AD Configuration
@@ -38,13 +55,59 @@ REDIRECT_PATH = os.getenv("REDIRECT_PATH")
 if REDIRECT_PATH is None:
     raise ValueError("REDIRECT_PATH environment variable is not set")
 SCOPE = ["User.Read"]
-SESSION = {}
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+PKCE_TTL = int(os.getenv("PKCE_TTL", "600"))
+session_store = build_session_store(
+    os.getenv("SESSION_STORE", "sqlite"), os.getenv("SESSION_STORE_PATH", "sessions.sqlite3")
+)
+session_signer = SessionSigner(os.getenv("SESSION_SECRET") or os.getenv("CHAINLIT_AUTH_SECRET"))
 
 # Initialize MSAL application
-msal_app = msal.ConfidentialClientApplication(
+msal_app = MSALClient(
     CLIENT_ID,
     authority=AUTHORITY,
-    client_credential=CLIENT_SECRET
+    client_credential=CLIENT_SECRET,
+    token_cache_path=os.getenv("MSAL_TOKEN_CACHE_PATH"),
+    max_workers=int(os.getenv("MSAL_EXECUTOR_WORKERS", "4")),
+)
+
+# Metrics exposed on /metrics
+metrics_registry = MetricsRegistry(multiproc_dir=os.getenv("METRICS_MULTIPROC_DIR"))
+BACKEND_LATENCY = metrics_registry.histogram(
+    "aidw_backend_request_seconds", "Latency of individual requests to the RAG backend"
+)
+FORMAT_TIME = metrics_registry.histogram(
+    "aidw_format_response_seconds",
+    "Time spent formatting a backend response",
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0),
+)
+CITATION_COUNT = metrics_registry.histogram(
+    "aidw_response_citations", "Citations per backend response", buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200)
+)
+ANSWER_SIZE = metrics_registry.histogram(
+    "aidw_answer_bytes",
+    "Size of backend answers before formatting",
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576),
+)
+BACKEND_RETRIES = metrics_registry.counter("aidw_backend_retries", "Backend request retries")
+BACKEND_TIMEOUTS = metrics_registry.counter("aidw_backend_timeouts", "Backend requests that timed out")
+ERRORS = metrics_registry.counter("aidw_errors", "Errors by type", labelnames=("type",))
+DISCONNECT_CANCELS = metrics_registry.counter(
+    "aidw_disconnect_cancellations", "Handlers cancelled because the user disconnected"
+)
+STARTER_CLICKS = metrics_registry.counter(
+    "aidw_starter_clicks", "Starter question clicks", labelnames=("question",)
+)
+metrics_registry.gauge(
+    "aidw_websocket_sessions", "Active websocket sessions", function=lambda: len(ws_sessions_sid)
+)
+
+# Tracing is off unless an exporter is configured
+tracer_provider = setup_tracing(
+    "aidw-chat",
+    sample_ratio=float(os.getenv("TRACE_SAMPLE_RATIO", "0.01")),
+    export_path=os.getenv("TRACE_EXPORT_PATH"),
+    otlp_endpoint=os.getenv("OTEL_EXPORTER_OTLP_TRACES_ENDPOINT"),
 )
 
 STARTER_QUESTIONS = [
@@ -74,51 +137,188 @@ STARTER_QUESTIONS = [
     }
 ]
 
+VISUALIZATION_CACHE_SIZE = int(os.getenv("VISUALIZATION_CACHE_SIZE", "256"))
+
 class DataVisualizationHandler:
-    @staticmethod
-    def process_chart(chart_data: str) -> str:
-        try:
-            data = json.loads(chart_data)
-            chart_elements = [
-                "```mermaid",
-                "pie",
-                f"title {data.get('title', 'Chart')}"
-            ]
-            for item in data.get('data', []):
-                chart_elements.append(f'    "{item["label"]}" : {item["value"]}')
-            chart_elements.append("```")
-            return '\n'.join(chart_elements)
-        except Exception as e:
-            logger.error(f"Chart generation error: {str(e)}")
-            return f"<!-- Error generating chart: {str(e)} -->"
+    BRACE_PATTERN = re.compile(r'[{}"\\]')
+    renderers: Dict[str, Callable[[Dict[str, Any]], str]] = {}
+    marker_pattern: Optional[re.Pattern] = None
+    _rendered: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
 
-    @staticmethod
-    def process_table(table_data: str) -> str:
-        try:
-            data = json.loads(table_data)
-            table_elements = ['| ' + ' | '.join(data.get('headers', [])) + ' |']
-            table_elements.append('| ' + ' | '.join(['---'] * len(data.get('headers', []))) + ' |')
-            for row in data.get('rows', []):
-                table_elements.append('| ' + ' | '.join(map(str, row)) + ' |')
-            return '\n'.join(table_elements)
-        except Exception as e:
-            logger.error(f"Table generation error: {str(e)}")
-            return f"<!-- Error generating table: {str(e)} -->"
+    @classmethod
+    def register(cls, marker: str) -> Callable:
+        """Register a renderer for {marker:...} blocks; it receives the parsed JSON payload."""
+        def decorator(renderer: Callable[[Dict[str, Any]], str]) -> Callable[[Dict[str, Any]], str]:
+            cls.renderers[marker] = renderer
+            # Longest names first so e.g. "flowchart" never loses to a shorter prefix
+            names = sorted(cls.renderers, key=len, reverse=True)
+            cls.marker_pattern = re.compile(r'\{(' + '|'.join(map(re.escape, names)) + r'):')
+            cls._rendered.clear()
+            return renderer
+        return decorator
+
+    @classmethod
+    def process(cls, marker: str, payload: str) -> str:
+        key = (marker, hashlib.blake2b(payload.encode('utf-8'), digest_size=16).digest())
+        cached = cls._rendered.get(key)
+        if cached is not None:
+            cls._rendered.move_to_end(key)
+            return cached
 
-    @staticmethod
-    def process_flowchart(flow_data: str) -> str:
         try:
-            data = json.loads(flow_data)
-            flow_elements = ["```mermaid", "flowchart TD"]
-            for node in data.get('nodes', []):
-                flow_elements.append(f"    {node['id']}[{node['label']}]")
-            for edge in data.get('edges', []):
-                flow_elements.append(f"    {edge['from']} --> {edge['to']}")
-            flow_elements.append("```")
-            return '\n'.join(flow_elements)
+            rendered = cls.renderers[marker](json.loads(payload))
         except Exception as e:
-            logger.error(f"Flowchart generation error: {str(e)}")
-            return f"<!-- Error generating flowchart: {str(e)} -->"
+            logger.error(f"{marker.capitalize()} generation error: {str(e)}")
+            return f"<!-- Error generating {marker}: {str(e)} -->"
+
+        cls._rendered[key] = rendered
+        if len(cls._rendered) > VISUALIZATION_CACHE_SIZE:
+            cls._rendered.popitem(last=False)
+        return rendered
+
+    @classmethod
+    def find_block_end(cls, text: str, start: int) -> int:
+        """Return the index of the brace closing a block opened just before start, or -1."""
+        depth = 1
+        in_string = False
+        pos = start
+        while True:
+            match = cls.BRACE_PATTERN.search(text, pos)
+            if match is None:
+                return -1
+            char = match.group()
+            pos = match.end()
+            if char == '\\':
+                # Skip whatever the backslash escapes
+                pos += 1
+            elif char == '"':
+                in_string = not in_string
+            elif in_string:
+                continue
+            elif char == '{':
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    return match.start()
+
+    def render(self, text: str) -> str:
+        """Replace every registered {marker:...} block in one pass."""
+        parts = []
+        pos = 0
+        while True:
+            match = self.marker_pattern.search(text, pos)
+            if match is None:
+                break
+            end = self.find_block_end(text, match.end())
+            if end == -1:
+                break
+            parts.append(text[pos:match.start()])
+            parts.append(self.process(match.group(1), text[match.end():end]))
+            pos = end + 1
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return ''.join(parts)
+
+    @classmethod
+    def process_chart(cls, chart_data: str) -> str:
+        return cls.process('chart', chart_data)
+
+    @classmethod
+    def process_table(cls, table_data: str) -> str:
+        return cls.process('table', table_data)
+
+    @classmethod
+    def process_flowchart(cls, flow_data: str) -> str:
+        return cls.process('flowchart', flow_data)
+
+@DataVisualizationHandler.register('chart')
+def render_pie_chart(data: Dict[str, Any]) -> str:
+    chart_elements = [
+        "```mermaid",
+        "pie",
+        f"title {data.get('title', 'Chart')}"
+    ]
+    for item in data.get('data', []):
+        chart_elements.append(f'    "{item["label"]}" : {item["value"]}')
+    chart_elements.append("```")
+    return '\n'.join(chart_elements)
+
+def _render_xychart(data: Dict[str, Any], series: str) -> str:
+    items = data.get('data', [])
+    labels = ', '.join(f'"{item["label"]}"' for item in items)
+    values = ', '.join(str(item["value"]) for item in items)
+    return '\n'.join([
+        "```mermaid",
+        "xychart-beta",
+        f'    title "{data.get("title", "Chart")}"',
+        f"    x-axis [{labels}]",
+        f"    {series} [{values}]",
+        "```"
+    ])
+
+@DataVisualizationHandler.register('bar')
+def render_bar_chart(data: Dict[str, Any]) -> str:
+    return _render_xychart(data, 'bar')
+
+@DataVisualizationHandler.register('line')
+def render_line_chart(data: Dict[str, Any]) -> str:
+    return _render_xychart(data, 'line')
+
+@DataVisualizationHandler.register('table')
+def render_table(data: Dict[str, Any]) -> str:
+    headers = data.get('headers', [])
+    out = io.StringIO()
+    out.write('| ')
+    out.write(' | '.join(headers))
+    out.write(' |\n| ')
+    out.write(' | '.join(['---'] * len(headers)))
+    out.write(' |')
+    for row in data.get('rows', []):
+        out.write('\n| ')
+        out.write(' | '.join(map(str, row)))
+        out.write(' |')
+    return out.getvalue()
+
+@DataVisualizationHandler.register('flowchart')
+def render_flowchart(data: Dict[str, Any]) -> str:
+    flow_elements = ["```mermaid", "flowchart TD"]
+    for node in data.get('nodes', []):
+        flow_elements.append(f"    {node['id']}[{node['label']}]")
+    for edge in data.get('edges', []):
+        flow_elements.append(f"    {edge['from']} --> {edge['to']}")
+    flow_elements.append("```")
+    return '\n'.join(flow_elements)
+
+@DataVisualizationHandler.register('sequence')
+def render_sequence_diagram(data: Dict[str, Any]) -> str:
+    sequence_elements = ["```mermaid", "sequenceDiagram"]
+    for participant in data.get('participants', []):
+        sequence_elements.append(f"    participant {participant}")
+    for message in data.get('messages', []):
+        sequence_elements.append(f"    {message['from']}->>{message['to']}: {message.get('text', '')}")
+    sequence_elements.append("```")
+    return '\n'.join(sequence_elements)
+
+@DataVisualizationHandler.register('gantt')
+def render_gantt_chart(data: Dict[str, Any]) -> str:
+    gantt_elements = [
+        "```mermaid",
+        "gantt",
+        f"    title {data.get('title', 'Timeline')}",
+        f"    dateFormat {data.get('dateFormat', 'YYYY-MM-DD')}"
+    ]
+    for section in data.get('sections', []):
+        gantt_elements.append(f"    section {section['name']}")
+        for task in section.get('tasks', []):
+            fields = [task[k] for k in ('id', 'start') if task.get(k)]
+            fields.append(task.get('end') or task.get('duration', '1d'))
+            gantt_elements.append(f"    {task['name']} :{', '.join(map(str, fields))}")
+    gantt_elements.append("```")
+    return '\n'.join(gantt_elements)
+
+CITATION_CACHE_SIZE = int(os.getenv("CITATION_CACHE_SIZE", "1024"))
 
 class ResponseFormatter:
     DOCUMENT_TYPES = {
@@ -128,40 +328,55 @@ class ResponseFormatter:
         'analysis': '📈',
         'default': '📄'
     }
+    DOCUMENT_TYPE_PATTERN = re.compile('|'.join(t for t in DOCUMENT_TYPES if t != 'default'))
+    SEPARATOR_PATTERN = re.compile(r'[_-]+')
 
     @staticmethod
     def get_document_emoji(filename: str) -> str:
-        lower_filename = filename.lower()
-        for doc_type, emoji in ResponseFormatter.DOCUMENT_TYPES.items():
-            if doc_type in lower_filename:
-                return emoji
+        found = set(ResponseFormatter.DOCUMENT_TYPE_PATTERN.findall(filename.lower()))
+        if found:
+            # Keep the DOCUMENT_TYPES precedence when several keywords appear
+            for doc_type, emoji in ResponseFormatter.DOCUMENT_TYPES.items():
+                if doc_type in found:
+                    return emoji
         return ResponseFormatter.DOCUMENT_TYPES['default']
 
     @staticmethod
     def clean_filename(filename: str) -> str:
-        cleaned = re.sub(r'[_-]+', ' ', filename)
+        cleaned = ResponseFormatter.SEPARATOR_PATTERN.sub(' ', filename)
         cleaned = ' '.join(word.capitalize() for word in cleaned.split())
         return cleaned.strip()
 
+    @staticmethod
+    @functools.lru_cache(maxsize=CITATION_CACHE_SIZE)
+    def normalize_citation(citation: str, hyperlink: str) -> Tuple[Optional[str], Optional[str], str]:
+        """Return (emoji, display name, encoded link); the name is None when nothing usable is left."""
+        filename = os.path.basename(citation).replace('%20', ' ').split('__')[0]
+        filename = ResponseFormatter.clean_filename(filename) if filename else ''
+        encoded_link = urllib.parse.quote(hyperlink, safe=':/?=&')
+        if not filename:
+            return None, None, encoded_link
+        return ResponseFormatter.get_document_emoji(filename), filename, encoded_link
+
     @staticmethod
     def format_citations(citations: List[str], hyperlinks: List[str]) -> str:
         if not citations or not hyperlinks:
             return ""
 
         formatted_citations = []
+        seen_links = set()
         for index, (citation, hyperlink) in enumerate(zip(citations, hyperlinks), 1):
             if not citation or not hyperlink:
                 continue
 
             try:
-                filename = os.path.basename(citation).replace('%20', ' ')
-                filename_parts = filename.split('__')
-                filename = filename_parts[0] if filename_parts and filename_parts[0] else f"Source {index}"
-                filename = ResponseFormatter.clean_filename(filename)
-                if not filename:
-                    filename = f"Source {index}"
-                emoji = ResponseFormatter.get_document_emoji(filename)
-                encoded_link = urllib.parse.quote(hyperlink, safe=':/?=&')
+                emoji, filename, encoded_link = ResponseFormatter.normalize_citation(citation, hyperlink)
+                # The backend often cites several chunks of the same document
+                if encoded_link in seen_links:
+                    continue
+                seen_links.add(encoded_link)
+                if filename is None:
+                    emoji, filename = ResponseFormatter.DOCUMENT_TYPES['default'], f"Source {index}"
                 formatted_citations.append(f"{emoji} [{filename}]({encoded_link})")
             except Exception as e:
                 logger.error(f"Citation formatting error for index {index}: {str(e)}")
@@ -169,67 +384,375 @@ class ResponseFormatter:
 
         return "\n".join(formatted_citations) if formatted_citations else ""
 
+def error_type(e: Exception) -> str:
+    if isinstance(e, httpx.HTTPStatusError):
+        return f"http_{e.response.status_code}"
+    return type(e).__name__
+
 class APIClient:
-    def __init__(self, base_url: str, max_retries: int = 3, timeout: int = 30):
+    RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+    BUSY_MESSAGE = "The assistant is handling a lot of questions right now. Please try again in a moment."
+
+    def __init__(
+        self,
+        base_url: str,
+        max_retries: int = 3,
+        timeout: int = 30,
+        max_connections: int = 100,
+        max_keepalive_connections: int = 20,
+        keepalive_expiry: float = 30.0,
+        http2: bool = False,
+        streaming: bool = False,
+        cache: Optional[ResponseCache] = None,
+        circuit_breaker: Optional[CircuitBreaker] = None,
+        retry_base_delay: float = 0.5,
+        retry_max_delay: float = 8.0,
+        admission: Optional[AdmissionController] = None,
+    ):
         self.base_url = base_url
         self.max_retries = max_retries
         self.timeout = timeout
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.http2 = http2
+        self.streaming = streaming
+        self.cache = cache
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.retry_base_delay = retry_base_delay
+        self.retry_max_delay = retry_max_delay
+        self.admission = admission or AdmissionController()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._inflight: Dict[str, asyncio.Task] = {}
+        # Waiters per task, so a request that replaced a finished or cancelled one starts its own count
+        self._inflight_waiters: Dict[asyncio.Task, int] = {}
+        self.request_count = 0
+        self.coalesced_count = 0
+        self.cancelled_count = 0
+        self.retry_count = 0
+        self.bytes_sent = 0
+        self.last_request_bytes = 0
         self.visualization_handler = DataVisualizationHandler()
 
-    async def make_request(self, message: str, chat_history: Optional[List[Dict[str, str]]] = None) -> Dict[str, Any]:
-        data = {
-            "query": message,
-            "chat_history": chat_history or []
-        }
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so every gunicorn worker opens its own pool after fork
+        if self._client is None or self._client.is_closed:
+            http2 = self.http2
+            if http2:
+                try:
+                    import h2  # noqa: F401
+                except ImportError:
+                    logger.warning("HTTP/2 requested but the 'h2' package is not installed, using HTTP/1.1")
+                    http2 = False
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(self.timeout),
+                limits=self.limits,
+                http2=http2,
+                headers={'Content-Type': 'application/json'},
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @traced("make_request")
+    async def make_request(
+        self,
+        message: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        refresh: bool = False,
+        on_queue_position: Optional[PositionCallback] = None,
+    ) -> Dict[str, Any]:
+        key = ResponseCache.make_key(message, chat_history)
+        self.request_count += 1
 
+        if self.cache is not None and not refresh:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                trace.get_current_span().set_attribute("cache.hit", True)
+                return cached
+
+        # Identical questions already in flight share a single backend call
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced_count += 1
+            trace.get_current_span().set_attribute("request.coalesced", True)
+        else:
+            task = asyncio.create_task(self._fetch(message, chat_history, key, on_queue_position))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget_inflight(key, done))
+
+        self._inflight_waiters[task] = self._inflight_waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            # Only abort the backend call once nobody is left waiting for it
+            if self._inflight_waiters.get(task) == 1 and not task.done():
+                # Unregister now: teardown can take a few loop iterations, and a new
+                # caller must start its own request rather than join a dying one
+                self._forget_inflight(key, task)
+                task.cancel()
+                self.cancelled_count += 1
+                logger.info("Backend request cancelled by the user")
+            raise
+        finally:
+            self._inflight_waiters[task] -= 1
+            if not self._inflight_waiters[task]:
+                del self._inflight_waiters[task]
+
+    def _forget_inflight(self, key: str, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+
+    async def _fetch(
+        self,
+        message: str,
+        chat_history: Optional[List[Dict[str, str]]],
+        key: str,
+        on_queue_position: Optional[PositionCallback] = None,
+    ) -> Dict[str, Any]:
+        # Fail fast while open; the probe slot itself is only taken once admitted
+        if self.circuit_breaker.is_open:
+            self.circuit_breaker.reject()
+            ERRORS.inc(type="circuit_open")
+            return await self._degraded_response(key)
+
+        try:
+            async with self.admission.slot(on_queue_position):
+                if not self.circuit_breaker.allow_request():
+                    ERRORS.inc(type="circuit_open")
+                    return await self._degraded_response(key)
+                try:
+                    return await self._send(message, chat_history, key)
+                finally:
+                    self.circuit_breaker.release()
+        except QueueFullError:
+            logger.warning("Backend queue full, shedding request")
+            ERRORS.inc(type="queue_full")
+            return {"error": self.BUSY_MESSAGE}
+
+    @staticmethod
+    def encode_body(message: str, chat_history: Optional[List[Dict[str, str]]], **extra: Any) -> bytes:
+        # A HistoryWindow already carries its JSON; splice it in rather than re-encoding every turn
+        history_json = getattr(chat_history, "json", None) or json.dumps(chat_history or [])
+        fields = [f'"query": {json.dumps(message)}', f'"chat_history": {history_json}']
+        fields.extend(f'{json.dumps(k)}: {json.dumps(v)}' for k, v in extra.items())
+        return ('{' + ', '.join(fields) + '}').encode('utf-8')
+
+    async def _send(self, message: str, chat_history: Optional[List[Dict[str, str]]], key: str) -> Dict[str, Any]:
+        body = self.encode_body(message, chat_history)
+        self._record_request_size(len(body))
+
+        delay = self.retry_base_delay
         for attempt in range(self.max_retries):
             try:
-                req = urllib.request.Request(
-                    self.base_url,
-                    data=json.dumps(data).encode('utf-8'),
-                    headers={'Content-Type': 'application/json'},
-                    method='POST'
-                )
+                started = time.perf_counter()
+                try:
+                    with tracer.start_as_current_span("backend.request") as span:
+                        span.set_attribute("retry.attempt", attempt + 1)
+                        async with asyncio.timeout(self.timeout):
+                            response = await self.client.post(self.base_url, content=body, headers=trace_headers(span))
+                        span.set_attribute("http.status_code", response.status_code)
+                finally:
+                    BACKEND_LATENCY.observe(time.perf_counter() - started)
+                if response.status_code not in self.RETRYABLE_STATUS_CODES:
+                    response.raise_for_status()
+                    result = response.json()
+                    self.circuit_breaker.record_success()
+                    if self.cache is not None:
+                        await self.cache.set(key, result)
+                    return result
+                logger.error(f"Request failed with HTTP {response.status_code} on attempt {attempt + 1}")
+                ERRORS.inc(type=f"http_{response.status_code}")
+                error = {"error": f"Service error: HTTP {response.status_code}"}
 
-                async with asyncio.timeout(self.timeout):
-                    response = await asyncio.to_thread(
-                        lambda: json.loads(urllib.request.urlopen(req).read().decode('utf-8'))
-                    )
-                return response
-
-            except asyncio.TimeoutError:
+            except (asyncio.TimeoutError, httpx.TimeoutException):
                 logger.error(f"Request timeout on attempt {attempt + 1}")
-                if attempt == self.max_retries - 1:
-                    return {"error": "Service timeout. Please try again later."}
-                await asyncio.sleep(2 ** attempt)
+                BACKEND_TIMEOUTS.inc()
+                error = {"error": "Service timeout. Please try again later."}
+
+            except httpx.TransportError as e:
+                logger.error(f"Request transport error on attempt {attempt + 1}: {str(e)}")
+                ERRORS.inc(type="transport")
+                error = {"error": f"Service error: {str(e)}"}
 
             except Exception as e:
                 logger.error(f"Request error: {str(e)}")
+                ERRORS.inc(type=error_type(e))
+                # Client errors say nothing about backend health
+                if not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500):
+                    self.circuit_breaker.record_failure()
                 return {"error": f"Service error: {str(e)}"}
 
+            self.circuit_breaker.record_failure()
+            if attempt == self.max_retries - 1 or self.circuit_breaker.is_open:
+                return error
+            # Decorrelated jitter keeps retries from many users from arriving in lockstep
+            delay = min(self.retry_max_delay, random.uniform(self.retry_base_delay, delay * 3))
+            self.retry_count += 1
+            BACKEND_RETRIES.inc()
+            await asyncio.sleep(delay)
+
+    async def _degraded_response(self, key: str) -> Dict[str, Any]:
+        stale = await self.cache.get_stale(key) if self.cache is not None else None
+        if stale is not None:
+            return stale
+        return {"error": "The knowledge service is temporarily unavailable. Please try again in a minute."}
+
+    def _record_request_size(self, size: int) -> None:
+        self.bytes_sent += size
+        self.last_request_bytes = size
+        logger.debug(f"Backend request body: {size} bytes")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.request_count,
+            "coalesced": self.coalesced_count,
+            "cancelled": self.cancelled_count,
+            "inflight": len(self._inflight),
+            "retries": self.retry_count,
+            "bytes_sent": self.bytes_sent,
+            "last_request_bytes": self.last_request_bytes,
+            "circuit": self.circuit_breaker.stats(),
+            "admission": self.admission.stats(),
+        }
+
+    async def stream_request(
+        self,
+        message: str,
+        chat_history: Optional[List[Dict[str, str]]] = None,
+        on_queue_position: Optional[PositionCallback] = None,
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        """Yield ("token", text) events as they arrive, then one ("response", dict).
+
+        Backends that answer with plain JSON produce a single "response" event, so
+        callers can always fall back to the blocking rendering path.
+        """
+        headers = {'Accept': 'text/event-stream, application/x-ndjson, application/json'}
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(message, chat_history)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                yield ("response", cached)
+                return
+
+        if self.circuit_breaker.is_open:
+            self.circuit_breaker.reject()
+            ERRORS.inc(type="circuit_open")
+            yield ("response", await self._degraded_response(cache_key or ResponseCache.make_key(message, chat_history)))
+            return
+
+        body = self.encode_body(message, chat_history, stream=True)
+        self._record_request_size(len(body))
+
+        span = tracer.start_span("backend.stream")
+        headers.update(trace_headers(span))
+        try:
+            async with self.admission.slot(on_queue_position):
+                if not self.circuit_breaker.allow_request():
+                    ERRORS.inc(type="circuit_open")
+                    yield ("response", await self._degraded_response(cache_key or ResponseCache.make_key(message, chat_history)))
+                    return
+                stream = self._stream(body, headers, cache_key)
+                try:
+                    async for event in stream:
+                        yield event
+                finally:
+                    await stream.aclose()
+                    self.circuit_breaker.release()
+        except QueueFullError:
+            logger.warning("Backend queue full, shedding streaming request")
+            ERRORS.inc(type="queue_full")
+            yield ("response", {"error": self.BUSY_MESSAGE})
+        finally:
+            span.end()
+
+    async def _stream(
+        self, body: bytes, headers: Dict[str, str], cache_key: Optional[str]
+    ) -> AsyncIterator[Tuple[str, Any]]:
+        tokens: List[str] = []
+        final: Dict[str, Any] = {}
+        started = time.perf_counter()
+
+        try:
+            async with self.client.stream('POST', self.base_url, content=body, headers=headers) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '')
+
+                if 'text/event-stream' not in content_type and 'ndjson' not in content_type:
+                    final = json.loads(await response.aread())
+                    BACKEND_LATENCY.observe(time.perf_counter() - started)
+                    self.circuit_breaker.record_success()
+                    if cache_key is not None:
+                        await self.cache.set(cache_key, final)
+                    yield ("response", final)
+                    return
+
+                async for line in response.aiter_lines():
+                    line = line.strip()
+                    if line.startswith('data:'):
+                        line = line[5:].strip()
+                    elif 'text/event-stream' in content_type:
+                        # SSE comments, event names and ids carry no payload for us
+                        continue
+                    if not line or line == '[DONE]':
+                        continue
+
+                    event = json.loads(line)
+                    if event.get('token'):
+                        tokens.append(event['token'])
+                        yield ("token", event['token'])
+                    final.update({k: v for k, v in event.items() if k != 'token'})
+
+        except (asyncio.CancelledError, GeneratorExit):
+            # Leaving the stream context closes the response and frees the connection
+            self.cancelled_count += 1
+            logger.info("Streaming request cancelled by the user")
+            raise
+        except httpx.TimeoutException:
+            logger.error("Streaming request timeout")
+            BACKEND_TIMEOUTS.inc()
+            self.circuit_breaker.record_failure()
+            final = {"error": "Service timeout. Please try again later."}
+        except Exception as e:
+            logger.error(f"Streaming request error: {str(e)}")
+            ERRORS.inc(type=error_type(e))
+            # Client errors say nothing about backend health
+            if not (isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500):
+                self.circuit_breaker.record_failure()
+            final = {"error": f"Service error: {str(e)}"}
+
+        BACKEND_LATENCY.observe(time.perf_counter() - started)
+        if 'error' not in final:
+            self.circuit_breaker.record_success()
+            if not final.get('answer'):
+                final['answer'] = ''.join(tokens)
+            if cache_key is not None:
+                await self.cache.set(cache_key, final)
+        yield ("response", final)
+
+    @tracer.start_as_current_span("process_response")
     def process_response(self, response: Dict[str, Any]) -> str:
         if 'error' in response:
             return f"⚠️ **Error:** {response['error']}"
 
+        started = time.perf_counter()
         try:
             answer = response.get('answer', '').strip()
             citations = response.get('citation', [])
             hyperlinks = response.get('hyperlink', [])
+            ANSWER_SIZE.observe(len(answer.encode('utf-8')))
+            CITATION_COUNT.observe(len(citations))
 
             # Process visualizations
-            for marker, processor in [
-                ('{chart:', self.visualization_handler.process_chart),
-                ('{table:', self.visualization_handler.process_table),
-                ('{flowchart:', self.visualization_handler.process_flowchart)
-            ]:
-                if marker in answer:
-                    pattern = f'{marker}(.*?)' + '}'
-                    matches = re.finditer(pattern, answer, re.DOTALL)
-                    for match in matches:
-                        original = match.group(0)
-                        data = match.group(1)
-                        replacement = processor(data)
-                        answer = answer.replace(original, replacement)
+            answer = self.visualization_handler.render(answer)
 
             formatted_text = ["**Assistant:**", answer]
             citations_text = ResponseFormatter.format_citations(citations, hyperlinks)
@@ -240,47 +763,231 @@ class APIClient:
 
         except Exception as e:
             logger.error(f"Response processing error: {str(e)}")
+            ERRORS.inc(type="formatting")
             return "⚠️ **Error:** Unable to process the response. Please try again."
+        finally:
+            FORMAT_TIME.observe(time.perf_counter() - started)
 
 # Initialize components
-api_client = APIClient(os.getenv("API_CLIENT_URL"))
-app = FastAPI()
+response_cache = None
+if os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true":
+    response_cache = ResponseCache(
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "600")),
+        max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+        shared=SQLiteCacheBackend(
+            os.getenv("RESPONSE_CACHE_SQLITE_PATH"),
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512")),
+        ) if os.getenv("RESPONSE_CACHE_SQLITE_PATH") else None,
+    )
+
+api_client = APIClient(
+    os.getenv("API_CLIENT_URL"),
+    max_connections=int(os.getenv("API_CLIENT_MAX_CONNECTIONS", "100")),
+    max_keepalive_connections=int(os.getenv("API_CLIENT_MAX_KEEPALIVE_CONNECTIONS", "20")),
+    keepalive_expiry=float(os.getenv("API_CLIENT_KEEPALIVE_EXPIRY", "30")),
+    http2=os.getenv("API_CLIENT_HTTP2", "false").lower() == "true",
+    streaming=os.getenv("API_CLIENT_STREAMING", "false").lower() == "true",
+    cache=response_cache,
+    circuit_breaker=CircuitBreaker(
+        failure_threshold=float(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "0.5")),
+        min_calls=int(os.getenv("CIRCUIT_MIN_CALLS", "10")),
+        window=float(os.getenv("CIRCUIT_WINDOW", "60")),
+        reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", "30")),
+    ),
+    retry_base_delay=float(os.getenv("API_CLIENT_RETRY_BASE_DELAY", "0.5")),
+    retry_max_delay=float(os.getenv("API_CLIENT_RETRY_MAX_DELAY", "8")),
+    admission=AdmissionController(
+        max_concurrency=int(os.getenv("BACKEND_MAX_CONCURRENCY", "16")),
+        max_queue=int(os.getenv("BACKEND_MAX_QUEUE", "64")),
+    ),
+)
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.getenv("CHAT_HISTORY_TOKEN_BUDGET", "3000"))
+# Optional coroutine that condenses turns dropped from the history window
+history_summarizer: Optional[Summarizer] = None
+
+metrics_registry.register(api_client.admission.wait_time)
+metrics_registry.register(api_client.circuit_breaker.rejections)
+metrics_registry.register(api_client.circuit_breaker.state_gauge)
+
+token_refresher = TokenRefresher(
+    token_store,
+    oauth_providers.get_oauth_provider,
+    skew=float(os.getenv("TOKEN_REFRESH_SKEW", "300")),
+    interval=float(os.getenv("TOKEN_REFRESH_INTERVAL", "60")),
+)
+
+# Formatted answers for STARTER_QUESTIONS, keyed by question, filled by the pre-warm task
+starter_answers: Dict[str, str] = {}
+
+async def prewarm_starter_answers(concurrency: int = 3) -> None:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def warm(question: str):
+        async with semaphore:
+            response = await api_client.make_request(question, refresh=True)
+            if 'error' in response:
+                logger.error(f"Starter pre-warm failed for '{question}': {response['error']}")
+                return
+            starter_answers[question] = api_client.process_response(response)
+
+    await asyncio.gather(*(warm(q["question"]) for q in STARTER_QUESTIONS))
+    logger.info(f"Pre-warmed {len(starter_answers)}/{len(STARTER_QUESTIONS)} starter answers")
+
+def drop_starter_answers(key: Optional[str]) -> None:
+    # Pre-warmed answers are served ahead of the cache, so they must go with it
+    for question in list(starter_answers):
+        if key is None or ResponseCache.make_key(question) == key:
+            del starter_answers[question]
+
+if response_cache is not None:
+    response_cache.invalidation_listeners.append(drop_starter_answers)
+
+async def refresh_starter_answers(interval: float, concurrency: int) -> None:
+    while True:
+        try:
+            await prewarm_starter_answers(concurrency)
+        except Exception as e:
+            logger.error(f"Starter pre-warm error: {str(e)}")
+        await asyncio.sleep(interval)
+
+STARTER_TITLES = {q["question"]: q["title"] for q in STARTER_QUESTIONS}
+
+async def write_metrics_snapshots(interval: float) -> None:
+    while True:
+        try:
+            metrics_registry.write_snapshot()
+        except Exception as e:
+            logger.error(f"Metrics snapshot error: {str(e)}")
+        await asyncio.sleep(interval)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    oauth_providers.get_http_client()
+    token_refresher.start()
+    prewarm_task = None
+    if os.getenv("PREWARM_STARTERS", "false").lower() == "true":
+        # Runs in the background so the worker accepts traffic immediately
+        prewarm_task = asyncio.create_task(refresh_starter_answers(
+            interval=float(os.getenv("PREWARM_INTERVAL", "1800")),
+            concurrency=int(os.getenv("PREWARM_CONCURRENCY", "3")),
+        ))
+    metrics_task = None
+    if metrics_registry.multiproc_dir:
+        metrics_task = asyncio.create_task(
+            write_metrics_snapshots(float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5")))
+        )
+    yield
+    if prewarm_task is not None:
+        prewarm_task.cancel()
+    if metrics_task is not None:
+        metrics_task.cancel()
+        metrics_registry.write_snapshot()
+    await token_refresher.stop()
+    await api_client.aclose()
+    await oauth_providers.close_http_client()
+    msal_app.shutdown()
+    if tracer_provider is not None:
+        # Flush spans still waiting in the batch processor
+        tracer_provider.shutdown()
+    if log_listener is not None:
+        log_listener.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    request_id = request.headers.get("X-Request-ID") or new_request_id()
+    request_id_var.set(request_id)
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
 
 # FastAPI routes
+def get_session_id(signed_cookie: Optional[str]) -> Optional[str]:
+    return session_signer.unsign(signed_cookie)
+
+async def get_user_email(session_id: Optional[str], default: str) -> str:
+    # SQLite can wait on another worker's write lock; keep that off the event loop
+    session = await asyncio.to_thread(session_store.get, f"user:{session_id}") if session_id else None
+    return session.get('user_email', default) if session else default
+
 @app.get("/")
-async def root():
+async def root(request: Request):
     code_verifier, code_challenge = generate_pkce_pair()
-    SESSION['code_verifier'] = code_verifier
-    auth_url = msal_app.get_authorization_request_url(
+    session_id = get_session_id(request.cookies.get(SESSION_COOKIE)) or new_session_id()
+    # The signed state ties the callback to this login, whichever worker receives it
+    state = session_signer.sign(new_session_id())
+    await asyncio.to_thread(
+        session_store.set, f"pkce:{state}", {"code_verifier": code_verifier, "session_id": session_id}, PKCE_TTL
+    )
+    auth_url = await msal_app.get_authorization_request_url(
         SCOPE,
+        state=state,
         redirect_uri=f"https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net{REDIRECT_PATH}",
         code_challenge=code_challenge,
         code_challenge_method='S256'
     )
-    return RedirectResponse(url=auth_url)
+    response = RedirectResponse(url=auth_url)
+    response.set_cookie(
+        SESSION_COOKIE, session_signer.sign(session_id), max_age=SESSION_TTL, httponly=True, secure=True, samesite="lax"
+    )
+    return response
 
 @app.get(REDIRECT_PATH)
 async def authorized(request: Request):
     code = request.query_params.get('code')
-    code_verifier = SESSION.pop('code_verifier', None)
-    if not code_verifier:
+    state = request.query_params.get('state')
+    pkce = await asyncio.to_thread(session_store.pop, f"pkce:{state}") if session_signer.unsign(state) else None
+    if not pkce:
         return {"error": "Code verifier not found in session."}
     
-    result = msal_app.acquire_token_by_authorization_code(
+    result = await msal_app.acquire_token_by_authorization_code(
         code,
         scopes=SCOPE,
         redirect_uri=f"https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net{REDIRECT_PATH}",
-        code_verifier=code_verifier
+        code_verifier=pkce['code_verifier']
     )
     
     if "access_token" in result:
-        SESSION['user_email'] = result.get('id_token_claims', {}).get('preferred_username', 'Unknown')
+        user_email = result.get('id_token_claims', {}).get('preferred_username', 'Unknown')
+        await asyncio.to_thread(session_store.set, f"user:{pkce['session_id']}", {"user_email": user_email}, SESSION_TTL)
         return RedirectResponse(url="https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net")
     return {"error": "Authentication failed"}
 
+def require_admin(token: Optional[str]):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or not token or not secrets.compare_digest(token, admin_token):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+@app.get("/admin/cache")
+async def cache_stats(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **(await response_cache.stats())}
+
+@app.delete("/admin/cache")
+async def invalidate_cache(query: Optional[str] = None, x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    if response_cache is None:
+        return {"enabled": False, "removed": 0}
+    # Without a query everything is dropped; with one, only its first-turn entry
+    key = ResponseCache.make_key(query) if query else None
+    return {"enabled": True, "removed": await response_cache.invalidate(key)}
+
+@app.get("/admin/backend")
+async def backend_stats(x_admin_token: Optional[str] = Header(None)):
+    require_admin(x_admin_token)
+    return api_client.stats()
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/chainlit")
-async def chainlit():
-    user_email = SESSION.get('user_email', 'Unknown')
+async def chainlit(request: Request):
+    user_email = await get_user_email(get_session_id(request.cookies.get(SESSION_COOKIE)), 'Unknown')
     await cl.Message(content=f"👋 **Welcome, {user_email}!**").send()
     return HTMLResponse('<meta http-equiv="refresh" content="0;url=https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net/">')
 
@@ -296,59 +1003,137 @@ async def start():
         ) for q in STARTER_QUESTIONS]
     ]
     
-    user_email = SESSION.get('user_email', 'Guest')
+    session_id = get_session_id(cookie_from_header(cl.context.session.http_cookie))
+    user_email = await get_user_email(session_id, 'Guest')
     await cl.Message(
         content=f"👋 **Welcome to AIDW Assistant, {user_email}!**\n\nI can help you with information about AI-driven workplace implementations. Select a starter question below or ask your own question.",
         actions=actions
     ).send()
 
+WAITING_STEP_NAME = "Crafting your response, please wait..."
+
+def queue_position_reporter(step: cl.Step):
+    """Keep the user informed of their place in line while the backend is saturated."""
+    async def report(position: int):
+        step.name = f"Waiting in line (position {position})..." if position else WAITING_STEP_NAME
+        await step.update()
+    return report
+
 @cl.action_callback("ask_question")
+@traced("on_action", root=True)
 async def on_action(action):
+    request_id_var.set(new_request_id())
     try:
         question = action.payload["question"]
+        STARTER_CLICKS.inc(question=STARTER_TITLES.get(question, "other"))
         formatted_question = f"**Question:** {question}\n\n"
         
-        async with cl.Step(name="Crafting your response, please wait..."):
-            response = await api_client.make_request(question)
-            text = api_client.process_response(response)
-            combined_text = formatted_question + text
+        if response_cache is not None and starter_answers:
+            # Pick up invalidations made on other workers before serving a pre-warmed answer
+            await response_cache.check_generation()
+        text = starter_answers.get(question)
+        if text is None:
+            async with cl.Step(name=WAITING_STEP_NAME) as step:
+                response = await api_client.make_request(question, on_queue_position=queue_position_reporter(step))
+                text = api_client.process_response(response)
+        combined_text = formatted_question + text
         
-        await cl.Message(content=combined_text).send()
+        with tracer.start_as_current_span("message.send"):
+            await cl.Message(content=combined_text).send()
     except Exception as e:
         logger.error(f"Action error: {str(e)}")
+        ERRORS.inc(type="handler")
         await cl.Message(content="⚠️ **Error:** Unable to process the question. Please try again.").send()
 
+async def stream_response(
+    question: str, chat_history: Optional[List[Dict[str, str]]] = None
+) -> Tuple[Dict[str, Any], str]:
+    msg = cl.Message(content="**Assistant:**\n")
+    streamed = False
+    response: Dict[str, Any] = {"error": "Empty response from service."}
+
+    async with cl.Step(name=WAITING_STEP_NAME) as step:
+        events = api_client.stream_request(question, chat_history, on_queue_position=queue_position_reporter(step))
+        try:
+            async for kind, value in events:
+                if kind == "token":
+                    await msg.stream_token(value)
+                    streamed = True
+                else:
+                    response = value
+        finally:
+            # Close the backend stream right away if the user stopped or disconnected
+            await events.aclose()
+
+    # Swap the raw tokens for the fully formatted answer with citations and visualizations
+    msg.content = api_client.process_response(response)
+    with tracer.start_as_current_span("message.send"):
+        if streamed:
+            await msg.update()
+        else:
+            await msg.send()
+    return response, msg.content
+
 @cl.on_message
+@traced("on_message", root=True)
 async def on_message(message: cl.Message):
+    request_id_var.set(new_request_id())
     try:
         if not message.content.strip():
             await cl.Message(content="❌ **Please enter a valid question**").send()
             return
 
-        chat_history = cl.user_session.get("chat_history", [])
-        
-        async with cl.Step(name="Crafting your response, please wait..."):
-            response = await api_client.make_request(message.content, chat_history)
-            text = api_client.process_response(response)
-            
-            # Update chat history
-            chat_history.append({"role": "user", "content": message.content})
-            chat_history.append({"role": "assistant", "content": text})
+        chat_history = cl.user_session.get("chat_history")
+        if chat_history is None:
+            chat_history = ChatHistory(token_budget=CHAT_HISTORY_TOKEN_BUDGET, summarizer=history_summarizer)
             cl.user_session.set("chat_history", chat_history)
-            
-            await cl.Message(content=text).send()
+        history_window = chat_history.window()
+
+        if api_client.streaming:
+            response, text = await stream_response(message.content, history_window)
+        else:
+            async with cl.Step(name=WAITING_STEP_NAME) as step:
+                response = await api_client.make_request(
+                    message.content, history_window, on_queue_position=queue_position_reporter(step)
+                )
+                text = api_client.process_response(response)
+                with tracer.start_as_current_span("message.send"):
+                    await cl.Message(content=text).send()
+
+        # Only successful answers become context for the next turn
+        if 'error' not in response:
+            chat_history.add_turn(message.content, response.get('answer', ''), text)
+            await chat_history.compact()
     except Exception as e:
         logger.error(f"Message error: {str(e)}")
+        ERRORS.inc(type="handler")
         await cl.Message(
             content="⚠️ **Error:** Unable to process your message. Please try again or contact support if the issue persists."
         ).send()
 
+@cl.on_chat_end
+async def on_chat_end():
+    # Chainlit only deletes a disconnected session after session_timeout, so
+    # stop the handler now and let the cancellation abort its backend call
+    task = cl.context.session.current_task
+    if task is not None and not task.done():
+        task.cancel()
+        DISCONNECT_CANCELS.inc()
+        logger.info("Cancelled the running handler of a disconnected session")
+
 @cl.on_logout
 async def on_logout():
     try:
+        # Stop renewing the user's IdP tokens
+        user = cl.user_session.get("user")
+        if user is not None:
+            token_store.remove(user.identifier)
+
         # Clear session data
         cl.user_session.clear()
-        SESSION.clear()
+        session_id = get_session_id(cookie_from_header(cl.context.session.http_cookie))
+        if session_id:
+            await asyncio.to_thread(session_store.delete, f"user:{session_id}")
         
         # Clear local storage
         await cl.local_storage.clear()
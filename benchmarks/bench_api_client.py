@@ -0,0 +1,92 @@
+"""Compare the legacy urllib + to_thread client with the pooled APIClient.
+
+Usage: python benchmarks/bench_api_client.py --requests 2000 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.request
+from typing import Awaitable, Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("REDIRECT_PATH", "/auth/callback")
+
+from stub_rag_server import StubRAGServer  # noqa: E402
+
+
+async def legacy_request(url: str, message: str) -> Dict:
+    req = urllib.request.Request(
+        url,
+        data=json.dumps({"query": message, "chat_history": []}).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    return await asyncio.to_thread(
+        lambda: json.loads(urllib.request.urlopen(req).read().decode("utf-8"))
+    )
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run(name: str, call: Callable[[str], Awaitable[Dict]], total: int, concurrency: int) -> Dict:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            started = time.perf_counter()
+            await call(f"question {i}")
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    elapsed = time.perf_counter() - started
+    result = {
+        "name": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "qps": round(total / elapsed, 1),
+    }
+    print(f"{name:<10} p50={result['p50_ms']}ms p99={result['p99_ms']}ms qps={result['qps']}")
+    return result
+
+
+async def main(args):
+    server = StubRAGServer(latency=args.latency).start()
+    os.environ.setdefault("API_CLIENT_URL", server.url)
+
+    from admission import AdmissionController
+    from app import APIClient
+
+    # Lift the default admission cap so both clients run at the same concurrency
+    client = APIClient(
+        server.url,
+        max_connections=args.concurrency,
+        max_keepalive_connections=args.concurrency,
+        admission=AdmissionController(max_concurrency=args.concurrency),
+    )
+    try:
+        await run("legacy", lambda q: legacy_request(server.url, q), args.requests, args.concurrency)
+        await run("pooled", lambda q: client.make_request(q), args.requests, args.concurrency)
+    finally:
+        await client.aclose()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.01)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,280 @@
+"""Micro-benchmark suite for the answer formatting code in app.py.
+
+Covers APIClient.process_response, ResponseFormatter.format_citations,
+normalize_citation, clean_filename and get_document_emoji, and every
+DataVisualizationHandler entry point and registered renderer. Synthetic
+answers range from 1 KB to 1 MB with 0-200 citations and 0-50 visualization
+blocks. Each case reports the best time per call and, from a separate
+tracemalloc pass, the bytes allocated (peak) and retained per call.
+
+"cold" cases clear the visualization and citation caches before every call,
+and the cost of clearing them is included in the timing. "warm" cases
+measure repeated answers.
+
+Usage: python benchmarks/bench_formatting.py [--quick] [--filter render] [--json results.json]
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import re
+import sys
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("REDIRECT_PATH", "/auth/callback")
+
+from app import APIClient, DataVisualizationHandler, ResponseFormatter  # noqa: E402
+
+KB = 1024
+SIZES = [1 * KB, 16 * KB, 256 * KB, 1024 * KB]
+CITATION_COUNTS = [0, 10, 50, 200]
+VISUALIZATION_COUNTS = [0, 5, 20, 50]
+
+WORDS = (
+    "the AIDW platform helped the customer reduce processing time across regional operations "
+    "while Azure OpenAI services improved response quality and cost efficiency for every team"
+).split()
+DOCUMENT_KINDS = ["annual_report", "case-study", "market_analysis", "research_study", "whitepaper"]
+
+
+def sample_payloads(rng: random.Random, index: int) -> Dict[str, Dict]:
+    """One realistic payload per registered marker; ``index`` keeps blocks distinct."""
+    labels = [f"Region {index}-{i}" for i in range(rng.randint(3, 8))]
+    points = [{"label": label, "value": rng.randint(1, 100)} for label in labels]
+    return {
+        "chart": {"title": f"Market share {index}", "data": points},
+        "bar": {"title": f"Savings {index}", "data": points},
+        "line": {"title": f"Adoption {index}", "data": points},
+        "table": {
+            "headers": ["Customer", "Country", "Savings", "Users"],
+            "rows": [[f"Customer {index}-{i}", "NL", rng.randint(1000, 99999), rng.randint(10, 5000)] for i in range(rng.randint(5, 20))],
+        },
+        "flowchart": {
+            "nodes": [{"id": f"N{i}", "label": f"Step {index}.{i}"} for i in range(6)],
+            "edges": [{"from": f"N{i}", "to": f"N{i + 1}"} for i in range(5)],
+        },
+        "sequence": {
+            "participants": ["User", "Assistant", "Backend"],
+            "messages": [
+                {"from": "User", "to": "Assistant", "text": f"question {index}"},
+                {"from": "Assistant", "to": "Backend", "text": "search"},
+                {"from": "Backend", "to": "Assistant", "text": "documents"},
+            ],
+        },
+        "gantt": {
+            "title": f"Rollout {index}",
+            "sections": [
+                {"name": "Pilot", "tasks": [{"name": "Design", "id": f"d{index}", "start": "2024-01-01", "duration": "10d"}]},
+                {"name": "Launch", "tasks": [{"name": "Deploy", "start": "2024-02-01", "end": "2024-03-01"}]},
+            ],
+        },
+    }
+
+
+def make_answer(size: int, visualizations: int, seed: int = 0) -> str:
+    """Prose of roughly ``size`` bytes with visualization blocks spread evenly through it."""
+    rng = random.Random(seed)
+    markers = sorted(DataVisualizationHandler.renderers)
+    blocks = []
+    for i in range(visualizations):
+        marker = markers[i % len(markers)]
+        blocks.append(f"{{{marker}:{json.dumps(sample_payloads(rng, i)[marker])}}}")
+
+    prose_size = max(0, size - sum(len(b) for b in blocks))
+    paragraphs = []
+    written = 0
+    while written < prose_size:
+        paragraph = " ".join(rng.choice(WORDS) for _ in range(60)).capitalize() + "."
+        paragraphs.append(paragraph)
+        written += len(paragraph) + 2
+
+    parts = []
+    step = max(1, len(paragraphs) // (visualizations + 1)) if visualizations else len(paragraphs) + 1
+    for i, paragraph in enumerate(paragraphs):
+        parts.append(paragraph)
+        if blocks and (i + 1) % step == 0:
+            parts.append(blocks.pop(0))
+    parts.extend(blocks)
+    return "\n\n".join(parts)
+
+
+def make_citations(count: int, distinct: int) -> Tuple[List[str], List[str]]:
+    distinct = max(1, distinct)
+    citations = [
+        f"docs/{DOCUMENT_KINDS[i % len(DOCUMENT_KINDS)]}_{i % distinct}%20v2__chunk{i}.pdf" for i in range(count)
+    ]
+    hyperlinks = [f"https://storage.example.com/docs/document {i % distinct}.pdf?sv=2024&sig=a b" for i in range(count)]
+    return citations, hyperlinks
+
+
+def legacy_render(handler: DataVisualizationHandler, answer: str) -> str:
+    for marker, processor in [
+        ('{chart:', handler.process_chart),
+        ('{table:', handler.process_table),
+        ('{flowchart:', handler.process_flowchart)
+    ]:
+        if marker in answer:
+            pattern = f'{marker}(.*?)' + '}'
+            for match in re.finditer(pattern, answer, re.DOTALL):
+                answer = answer.replace(match.group(0), processor(match.group(1)))
+    return answer
+
+
+def clear_caches() -> None:
+    DataVisualizationHandler._rendered.clear()
+    ResponseFormatter.normalize_citation.cache_clear()
+
+
+class Case:
+    def __init__(self, group: str, name: str, fn: Callable[[], object], cold: bool = False):
+        self.group = group
+        self.name = name
+        self.cold = cold
+        self.fn = (lambda: (clear_caches(), fn())) if cold else fn
+        self.warmup = fn
+
+
+def measure(case: Case, repeat: int, min_time: float) -> Dict:
+    case.warmup()
+    timer = timeit.Timer(case.fn)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    seconds = min(timer.repeat(repeat=repeat, number=number)) / number
+
+    if case.cold:
+        clear_caches()
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = case.fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+
+    return {
+        "group": case.group,
+        "name": case.name,
+        "us_per_call": round(seconds * 1e6, 2),
+        "calls": number,
+        "alloc_peak_kb": round((peak - baseline) / KB, 1),
+        "retained_kb": round((current - baseline) / KB, 1),
+    }
+
+
+def process_response_cases(client: APIClient, quick: bool) -> List[Case]:
+    cases = []
+    sizes = SIZES[:2] if quick else SIZES
+    for size in sizes:
+        for visualizations in ([0, 5] if quick else VISUALIZATION_COUNTS):
+            citations, hyperlinks = make_citations(50, 20)
+            response = {"answer": make_answer(size, visualizations), "citation": citations, "hyperlink": hyperlinks}
+            label = f"{size // KB}KB/{visualizations}viz/50cit/20docs"
+            cases.append(Case("process_response", f"cold {label}", lambda r=response: client.process_response(r), cold=True))
+            cases.append(Case("process_response", f"warm {label}", lambda r=response: client.process_response(r)))
+    for count in CITATION_COUNTS:
+        distinct = max(1, count // 2)
+        citations, hyperlinks = make_citations(count, distinct)
+        response = {"answer": make_answer(16 * KB, 5), "citation": citations, "hyperlink": hyperlinks}
+        label = f"16KB/5viz/{count}cit/{distinct}docs"
+        cases.append(Case("process_response", f"cold {label}", lambda r=response: client.process_response(r), cold=True))
+    return cases
+
+
+def render_cases(handler: DataVisualizationHandler, quick: bool) -> List[Case]:
+    cases = []
+    sizes = SIZES[:2] if quick else SIZES
+    for size in sizes:
+        for visualizations in ([0, 5] if quick else VISUALIZATION_COUNTS):
+            answer = make_answer(size, visualizations)
+            label = f"{size // KB}KB/{visualizations}viz"
+            cases.append(Case("render", f"cold {label}", lambda a=answer: handler.render(a), cold=True))
+            cases.append(Case("render", f"warm {label}", lambda a=answer: handler.render(a)))
+            if size <= 256 * KB:
+                cases.append(Case("render", f"legacy {label}", lambda a=answer: legacy_render(handler, a), cold=True))
+    return cases
+
+
+def visualization_cases() -> List[Case]:
+    cases = []
+    payloads = sample_payloads(random.Random(0), 0)
+    for marker, renderer in sorted(DataVisualizationHandler.renderers.items()):
+        data = payloads[marker]
+        raw = json.dumps(data)
+        cases.append(Case("renderers", f"{renderer.__name__}", lambda r=renderer, d=data: r(d)))
+        cases.append(Case("renderers", f"process {marker} cold", lambda m=marker, p=raw: DataVisualizationHandler.process(m, p), cold=True))
+    for name in ("process_chart", "process_table", "process_flowchart"):
+        marker = name.split("_", 1)[1]
+        method = getattr(DataVisualizationHandler, name)
+        raw = json.dumps(payloads[marker])
+        cases.append(Case("renderers", f"{name} cold", lambda f=method, p=raw: f(p), cold=True))
+        cases.append(Case("renderers", f"{name} warm", lambda f=method, p=raw: f(p)))
+
+    # A large block with nested braces and escaped quotes in strings
+    table = {"headers": ["Key", "Value"], "rows": [[f"k{i}", f'{{"nested": "va\\"lue {i}"}}'] for i in range(2000)]}
+    text = json.dumps(table) + "} trailing text"
+    cases.append(Case("renderers", f"find_block_end {len(text) // KB}KB", lambda: DataVisualizationHandler.find_block_end(text, 1)))
+    return cases
+
+
+def citation_cases() -> List[Case]:
+    cases = []
+    for count in CITATION_COUNTS:
+        for distinct in sorted({count, max(1, count // 5)}) if count else [0]:
+            citations, hyperlinks = make_citations(count, distinct)
+            label = f"{count}cit/{distinct}docs"
+            cases.append(Case("citations", f"format_citations cold {label}",
+                              lambda c=citations, h=hyperlinks: ResponseFormatter.format_citations(c, h), cold=True))
+            cases.append(Case("citations", f"format_citations warm {label}",
+                              lambda c=citations, h=hyperlinks: ResponseFormatter.format_citations(c, h)))
+
+    citations, hyperlinks = make_citations(200, 200)
+    filenames = [os.path.basename(c).replace("%20", " ").split("__")[0] for c in citations]
+    cases.append(Case("citations", "clean_filename x200",
+                      lambda: [ResponseFormatter.clean_filename(f) for f in filenames]))
+    cases.append(Case("citations", "get_document_emoji x200",
+                      lambda: [ResponseFormatter.get_document_emoji(f) for f in filenames]))
+    cases.append(Case("citations", "normalize_citation cold x200",
+                      lambda: [ResponseFormatter.normalize_citation(c, h) for c, h in zip(citations, hyperlinks)], cold=True))
+    return cases
+
+
+def main(args) -> None:
+    # The legacy renderer logs an error for every nested block it mangles
+    logging.disable(logging.CRITICAL)
+    client = APIClient("http://localhost")
+    cases = (
+        process_response_cases(client, args.quick)
+        + render_cases(client.visualization_handler, args.quick)
+        + visualization_cases()
+        + citation_cases()
+    )
+    if args.filter:
+        cases = [c for c in cases if args.filter in f"{c.group} {c.name}"]
+
+    results = []
+    print(f"{'case':<52} {'us/call':>12} {'alloc KB':>10} {'kept KB':>9}")
+    for case in cases:
+        result = measure(case, args.repeat, args.min_time)
+        results.append(result)
+        print(f"{case.group + ': ' + case.name:<52} {result['us_per_call']:>12.1f} "
+              f"{result['alloc_peak_kb']:>10.1f} {result['retained_kb']:>9.1f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"config": vars(args), "results": results}, f, indent=2)
+        print(f"results written to {args.json}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="only answers up to 16 KB with 0 or 5 visualizations")
+    parser.add_argument("--filter", help="only run cases whose group or name contains this text")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="approximate seconds per timing run")
+    parser.add_argument("--json", help="write results to this file")
+    main(parser.parse_args())
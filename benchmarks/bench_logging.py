@@ -0,0 +1,120 @@
+"""Compare event-loop latency under the old FileHandler setup and the queue pipeline.
+
+A ticker coroutine sleeps for 1 ms in a loop and records how late it wakes
+up, while producer coroutines log at a fixed rate. With the old setup every
+record is formatted and written on the event loop; with log_pipeline only a
+queue put happens there. --disk-latency adds a sleep to each file write to
+mimic a slow or network-mounted disk.
+
+Usage: python benchmarks/bench_logging.py --rate 5000 --disk-latency 0.0005
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import log_pipeline  # noqa: E402
+
+
+def slow_down(handler: logging.Handler, latency: float) -> None:
+    if latency <= 0:
+        return
+    emit = handler.emit
+
+    def slow_emit(record):
+        time.sleep(latency)
+        emit(record)
+
+    handler.emit = slow_emit
+
+
+def setup_legacy(directory: str, latency: float):
+    file_handler = logging.FileHandler(os.path.join(directory, "legacy.log"))
+    slow_down(file_handler, latency)
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        handlers=[logging.StreamHandler(), file_handler],
+        force=True,
+    )
+    return None
+
+
+def setup_pipeline(directory: str, latency: float):
+    os.environ["LOG_FILE"] = os.path.join(directory, "pipeline.log")
+    listener = log_pipeline.configure_logging(logging.INFO)
+    for handler in listener.handlers:
+        if isinstance(handler, logging.FileHandler):
+            slow_down(handler, latency)
+    return listener
+
+
+async def measure(rate: int, duration: float, error_ratio: float):
+    logger = logging.getLogger("bench")
+    lags = []
+    log_calls = []
+    stop = time.perf_counter() + duration
+
+    async def ticker():
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    async def producer():
+        interval = 1 / rate
+        i = 0
+        while time.perf_counter() < stop:
+            started = time.perf_counter()
+            if error_ratio and i % int(1 / error_ratio) == 0:
+                logger.error(f"Request error: backend unavailable (request {i})")
+            else:
+                logger.info(f"Handled request {i}")
+            log_calls.append(time.perf_counter() - started)
+            i += 1
+            await asyncio.sleep(interval)
+
+    await asyncio.gather(ticker(), producer())
+    return lags, log_calls
+
+
+def percentile(values, pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def report(name: str, lags, log_calls) -> None:
+    print(
+        f"{name:<9} loop lag p50 {percentile(lags, 50) * 1000:6.2f} ms  "
+        f"p99 {percentile(lags, 99) * 1000:6.2f} ms  max {max(lags) * 1000:7.2f} ms  |  "
+        f"log call mean {statistics.mean(log_calls) * 1e6:7.1f} us  "
+        f"p99 {percentile(log_calls, 99) * 1e6:7.1f} us  ({len(log_calls)} records)"
+    )
+
+
+def main(args):
+    # Console output would dominate the measurement; both setups write to /dev/null
+    sys.stderr = open(os.devnull, "w")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, setup in (("legacy", setup_legacy), ("pipeline", setup_pipeline)):
+            listener = setup(directory, args.disk_latency)
+            lags, log_calls = asyncio.run(measure(args.rate, args.duration, args.error_ratio))
+            if listener is not None:
+                listener.stop()
+            report(name, lags, log_calls)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rate", type=int, default=2000, help="log records per second")
+    parser.add_argument("--duration", type=float, default=3.0)
+    parser.add_argument("--error-ratio", type=float, default=0.1)
+    parser.add_argument("--disk-latency", type=float, default=0.0, help="seconds added to each file write")
+    main(parser.parse_args())
@@ -0,0 +1,125 @@
+"""Event-loop latency during concurrent MSAL logins, on the loop versus MSALClient.
+
+msal.ConfidentialClientApplication is replaced with a stand-in that sleeps
+like the real one blocks: once for OpenID discovery when it is constructed
+and once per token request. A ticker coroutine sleeps for 1 ms in a loop and
+records how late it wakes up while N logins run at once. "legacy" calls the
+application directly from the coroutine, as app.py did before MSALClient;
+"executor" goes through MSALClient. The discovery count shows that
+concurrent first calls construct the application only once.
+
+Usage: python benchmarks/bench_msal.py --logins 50 --token-latency 0.2
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import threading
+import time
+from typing import List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import msal  # noqa: E402
+
+import msal_client  # noqa: E402
+
+
+class SlowConfidentialClientApplication:
+    discoveries = 0
+    latency = {"discovery": 0.0, "token": 0.0}
+    _lock = threading.Lock()
+
+    def __init__(self, client_id, authority=None, client_credential=None, token_cache=None, http_cache=None):
+        with self._lock:
+            SlowConfidentialClientApplication.discoveries += 1
+        time.sleep(self.latency["discovery"])
+        self.client_id = client_id
+
+    def get_authorization_request_url(self, scopes, **kwargs):
+        return f"https://login.example.com/authorize?client_id={self.client_id}&state={kwargs.get('state', '')}"
+
+    def acquire_token_by_authorization_code(self, code, scopes, **kwargs):
+        time.sleep(self.latency["token"])
+        return {"access_token": f"access-{code}", "id_token_claims": {"preferred_username": "user@example.com"}}
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def measure(login, logins: int):
+    lags: List[float] = []
+    done = asyncio.Event()
+
+    async def ticker():
+        while not done.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - started - 0.001)
+
+    async def run_logins():
+        # Let the ticker settle before the burst arrives
+        await asyncio.sleep(0.05)
+        try:
+            await asyncio.gather(*(login(f"code-{i}") for i in range(logins)))
+        finally:
+            done.set()
+
+    started = time.perf_counter()
+    await asyncio.gather(ticker(), run_logins())
+    return lags, time.perf_counter() - started
+
+
+async def legacy(args):
+    application = None
+
+    async def login(code: str):
+        nonlocal application
+        if application is None:
+            application = msal.ConfidentialClientApplication("client", authority=args.authority, client_credential="secret")
+        application.get_authorization_request_url(["User.Read"], state=code)
+        return application.acquire_token_by_authorization_code(code, scopes=["User.Read"])
+
+    return await measure(login, args.logins)
+
+
+async def executor(args):
+    client = msal_client.MSALClient("client", args.authority, "secret", max_workers=args.workers)
+
+    async def login(code: str):
+        await client.get_authorization_request_url(["User.Read"], state=code)
+        return await client.acquire_token_by_authorization_code(code, scopes=["User.Read"])
+
+    try:
+        return await measure(login, args.logins)
+    finally:
+        client.shutdown()
+
+
+def main(args):
+    SlowConfidentialClientApplication.latency = {"discovery": args.discovery_latency, "token": args.token_latency}
+    msal.ConfidentialClientApplication = SlowConfidentialClientApplication
+
+    print(f"{args.logins} concurrent logins, discovery {args.discovery_latency * 1000:.0f} ms, "
+          f"token request {args.token_latency * 1000:.0f} ms, {args.workers} executor threads")
+    for name, run in (("legacy", legacy), ("executor", executor)):
+        SlowConfidentialClientApplication.discoveries = 0
+        lags, elapsed = asyncio.run(run(args))
+        print(
+            f"{name:<9} loop lag p50 {percentile(lags, 50) * 1000:7.2f} ms  "
+            f"p99 {percentile(lags, 99) * 1000:7.2f} ms  max {max(lags) * 1000:8.2f} ms  |  "
+            f"{elapsed:6.2f}s total, {len(lags)} ticks, {SlowConfidentialClientApplication.discoveries} discovery"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=4, help="MSALClient executor threads")
+    parser.add_argument("--discovery-latency", type=float, default=0.3)
+    parser.add_argument("--token-latency", type=float, default=0.2)
+    parser.add_argument("--authority", default="https://login.microsoftonline.com/common")
+    main(parser.parse_args())
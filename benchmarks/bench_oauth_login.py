@@ -0,0 +1,82 @@
+"""Login latency with a fresh httpx client per call versus the shared OAuth pool.
+
+Usage: python benchmarks/bench_oauth_login.py --logins 500 --concurrency 50
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from typing import List
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_idp import FakeIdPServer  # noqa: E402
+
+
+async def legacy_login(base_url: str) -> None:
+    async with httpx.AsyncClient() as client:
+        response = await client.post(f"{base_url}/token", data={"code": "abc"})
+        token = response.json()["access_token"]
+    async with httpx.AsyncClient() as client:
+        await client.get(f"{base_url}/userinfo", headers={"Authorization": f"Bearer {token}"})
+
+
+async def pooled_login(provider) -> None:
+    token = await provider.get_token("abc", "http://localhost/callback")
+    await provider.get_user_info(token)
+
+
+async def run(name: str, login, total: int, concurrency: int) -> None:
+    latencies: List[float] = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            await login()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name:<8} p50={statistics.median(latencies) * 1000:.2f}ms "
+        f"p99={p99 * 1000:.2f}ms logins/s={total / elapsed:.1f}"
+    )
+
+
+async def main(args):
+    idp = FakeIdPServer(latency=args.latency).start()
+    os.environ.update({
+        "OAUTH_GENERIC_CLIENT_ID": "client",
+        "OAUTH_GENERIC_CLIENT_SECRET": "secret",
+        "OAUTH_GENERIC_AUTH_URL": f"{idp.url}/authorize",
+        "OAUTH_GENERIC_TOKEN_URL": f"{idp.url}/token",
+        "OAUTH_GENERIC_USER_INFO_URL": f"{idp.url}/userinfo",
+        "OAUTH_GENERIC_SCOPES": "openid email",
+    })
+
+    import oauth_providers
+
+    provider = oauth_providers.GenericOAuthProvider()
+    try:
+        await run("legacy", lambda: legacy_login(idp.url), args.logins, args.concurrency)
+        await run("pooled", lambda: pooled_login(provider), args.logins, args.concurrency)
+    finally:
+        await oauth_providers.close_http_client()
+        idp.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
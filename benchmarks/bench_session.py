@@ -0,0 +1,100 @@
+"""Benchmark clean_metadata on large user sessions.
+
+Compares the previous implementation (encode, parse, encode again to
+measure, then redact everything if too large) with the single-pass
+size-bounded sanitizer. Sessions hold a ChatHistory with long answers plus
+the odd non-serializable object, from about 100 KB up to well past the
+1 MB limit. Reports time per call, peak allocation from tracemalloc and
+how much of the session survived.
+
+Usage: python benchmarks/bench_session.py --sizes 100,1000,5000,20000
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chainlit_session import JSONEncoderIgnoreNonSerializable, clean_metadata  # noqa: E402
+from chat_history import ChatHistory  # noqa: E402
+
+
+def legacy_clean_metadata(metadata, max_size: int = 1048576):
+    cleaned_metadata = json.loads(
+        json.dumps(metadata, cls=JSONEncoderIgnoreNonSerializable, ensure_ascii=False)
+    )
+
+    metadata_size = len(json.dumps(cleaned_metadata).encode("utf-8"))
+    if metadata_size > max_size:
+        cleaned_metadata = {
+            "message": f"Metadata size exceeds the limit of {max_size} bytes. Redacted."
+        }
+
+    return cleaned_metadata
+
+
+def make_session(size_kb: int) -> dict:
+    history = ChatHistory(token_budget=10 ** 9)
+    answer = ("The AIDW rollout cut complaint handling from 30 to 5 minutes per letter. " * 40)[:2800]
+    rendered = "**Assistant:**\n" + answer + "\n\n**Learn more:**\n📊 [Annual Report](https://example.com/a.pdf)"
+    turns = max(1, size_kb * 1024 // (len(answer) + len(rendered) + 200))
+    for i in range(turns):
+        history.add_turn(f"Question {i}: how did Azure OpenAI help ABN AMRO?", answer, rendered)
+    return {
+        "id": "session-id",
+        "env": {},
+        "chat_settings": {"model": "default", "temperature": 0.2},
+        "chat_profile": None,
+        "http_referer": "https://aidw.example.com/",
+        "client_type": "webapp",
+        "chat_history": history,
+        "lock": threading.Lock(),
+        "starter_clicks": list(range(50)),
+    }
+
+
+def encoded_size(value) -> int:
+    return len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+
+def measure(fn, session) -> dict:
+    timer = timeit.Timer(lambda: fn(session))
+    number, _ = timer.autorange()
+    seconds = min(timer.repeat(repeat=3, number=number)) / number
+
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    tracemalloc.reset_peak()
+    result = fn(session)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "ms": seconds * 1000,
+        "peak_kb": (peak - baseline) / 1024,
+        "kept_kb": encoded_size(result) / 1024,
+        "turns": len(result.get("chat_history", {}).get("turns", [])) if isinstance(result.get("chat_history"), dict) else 0,
+    }
+
+
+def main(args):
+    print(f"{'session':>9} {'impl':<8} {'ms/call':>9} {'peak KB':>10} {'kept KB':>9} {'turns kept':>11}")
+    for size_kb in args.sizes:
+        session = make_session(size_kb)
+        actual_kb = encoded_size(json.loads(json.dumps(session, cls=JSONEncoderIgnoreNonSerializable))) / 1024
+        for name, fn in (("legacy", legacy_clean_metadata), ("bounded", clean_metadata)):
+            result = measure(lambda s, f=fn: f(s, max_size=args.max_size), session)
+            print(f"{actual_kb:>7.0f}KB {name:<8} {result['ms']:>9.2f} {result['peak_kb']:>10.0f} "
+                  f"{result['kept_kb']:>9.0f} {result['turns']:>11}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=lambda v: [int(s) for s in v.split(",")], default=[100, 1000, 5000, 20000],
+                        help="approximate session sizes in KB")
+    parser.add_argument("--max-size", type=int, default=1048576)
+    main(parser.parse_args())
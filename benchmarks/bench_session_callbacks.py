@@ -0,0 +1,59 @@
+"""Multi-worker PKCE login simulation for the session stores.
+
+Each login starts on one worker process and its callback is handled by
+whichever worker picks it up, as with gunicorn -w 4. Reports the share of
+callbacks that found their code verifier.
+
+Usage: python benchmarks/bench_session_callbacks.py --workers 4 --logins 2000
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session_store import SessionSigner, build_session_store, new_session_id  # noqa: E402
+
+store = None
+signer = SessionSigner("benchmark-secret")
+
+
+def init_worker(backend: str, path: str) -> None:
+    global store
+    store = build_session_store(backend, path)
+
+
+def start_login(_) -> str:
+    state = signer.sign(new_session_id())
+    store.set(f"pkce:{state}", {"code_verifier": new_session_id(), "session_id": new_session_id()}, 600)
+    return state
+
+
+def callback(state: str) -> bool:
+    return signer.unsign(state) is not None and store.pop(f"pkce:{state}") is not None
+
+
+def run(backend: str, workers: int, logins: int, path: str) -> None:
+    with multiprocessing.get_context("fork").Pool(workers, initializer=init_worker, initargs=(backend, path)) as pool:
+        started = time.perf_counter()
+        states = pool.map(start_login, range(logins), chunksize=1)
+        results = pool.map(callback, reversed(states), chunksize=1)
+        elapsed = time.perf_counter() - started
+    success = sum(results)
+    print(f"{backend:<7} {success}/{logins} callbacks succeeded ({success / logins:.1%}), "
+          f"{2 * logins / elapsed:.0f} requests/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--logins", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for backend in ("memory", "sqlite"):
+            run(backend, args.workers, args.logins, os.path.join(tmp, "sessions.sqlite3"))
@@ -0,0 +1,70 @@
+"""Exercise TokenRefresher against a local fake token endpoint.
+
+Checks that concurrent callers for one user share a single refresh, then
+measures how long a background pass takes to renew many expiring users.
+
+Usage: python benchmarks/bench_token_refresh.py --users 1000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_idp import FakeIdPServer  # noqa: E402
+
+
+async def main(args):
+    idp = FakeIdPServer(latency=args.latency, expires_in=args.expires_in).start()
+    os.environ.update({
+        "OAUTH_GENERIC_CLIENT_ID": "client",
+        "OAUTH_GENERIC_CLIENT_SECRET": "secret",
+        "OAUTH_GENERIC_AUTH_URL": f"{idp.url}/authorize",
+        "OAUTH_GENERIC_TOKEN_URL": f"{idp.url}/token",
+        "OAUTH_GENERIC_USER_INFO_URL": f"{idp.url}/userinfo",
+        "OAUTH_GENERIC_SCOPES": "openid email",
+    })
+
+    import oauth_providers
+    from token_refresh import TokenRefresher, TokenSet, TokenStore
+
+    provider_id = oauth_providers.GenericOAuthProvider.id
+    store = TokenStore()
+    refresher = TokenRefresher(store, oauth_providers.get_oauth_provider, skew=args.skew, concurrency=args.concurrency)
+
+    try:
+        # Single-flight: 50 concurrent callers for one expired user
+        store.set("solo", TokenSet(provider_id, "old", "refresh", time.time()))
+        before = idp.token_requests
+        tokens = await asyncio.gather(*(refresher.get_access_token("solo") for _ in range(50)))
+        print(f"single-flight: 50 callers -> {idp.token_requests - before} token request(s), "
+              f"{len(set(tokens))} distinct token(s)")
+
+        # Renewal timing: every user expires inside the skew window
+        expires_at = time.time() + args.skew / 2
+        for i in range(args.users):
+            store.set(f"user-{i}", TokenSet(provider_id, f"old-{i}", f"refresh-{i}", expires_at))
+        before = idp.token_requests
+        started = time.perf_counter()
+        await refresher.refresh_expiring()
+        elapsed = time.perf_counter() - started
+        renewed = sum(1 for i in range(args.users) if store.get(f"user-{i}").expires_at > expires_at)
+        print(f"renewed {renewed}/{args.users} users with {idp.token_requests - before} requests "
+              f"in {elapsed:.2f}s ({args.users / elapsed:.0f} refreshes/s)")
+        print(f"stats: {refresher.stats()}")
+    finally:
+        await oauth_providers.close_http_client()
+        idp.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--skew", type=float, default=60)
+    parser.add_argument("--expires-in", type=int, default=3600)
+    parser.add_argument("--latency", type=float, default=0.005)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""Local stand-in for an OAuth identity provider and Microsoft Graph."""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+
+class FakeIdPHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, payload, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode("utf-8"))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.server.token_requests += 1
+        grant = form.get("grant_type", ["authorization_code"])[0]
+        self._send_json({
+            "access_token": f"access-{self.server.token_requests}",
+            "refresh_token": f"refresh-{self.server.token_requests}",
+            "expires_in": self.server.expires_in,
+            "token_type": "Bearer",
+            "grant_type": grant,
+        })
+
+    def do_GET(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if "/photos/" in self.path:
+            body = b"\x89PNG fake avatar"
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("ETag", '"avatar-v1"')
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self._send_json({
+            "email": "user@example.com",
+            "userPrincipalName": "user@example.com",
+            "picture": "",
+        })
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeIdPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, expires_in: int = 3600):
+        super().__init__((host, port), FakeIdPHandler)
+        self.latency = latency
+        self.expires_in = expires_in
+        self.token_requests = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeIdPServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,335 @@
+"""Drive simulated Chainlit users through the whole chat path against local stubs.
+
+A stub RAG backend and a fake identity provider run in this process. Each
+worker process imports app.py, as a gunicorn worker would, and runs its
+share of users concurrently. A user logs in through the Azure AD OAuth
+provider (token exchange, Graph profile and photo, all routed to the fake
+IdP), opens a chat, clicks starter questions and sends several messages.
+Every handler call runs inside a real WebsocketSession context.
+
+Prints throughput and p50/p95/p99 latency per step plus CPU time and RSS
+per worker, and writes everything to a JSON file named after the current
+commit so runs can be compared with --compare.
+
+Usage: python benchmarks/load_test.py --users 200 --workers 4 --turns 3
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_idp import FakeIdPServer  # noqa: E402
+from stub_rag_server import StubRAGServer, build_answer  # noqa: E402
+
+STEPS = ("login", "chat_start", "action", "message")
+
+
+class FakeIdPTransport(httpx.AsyncBaseTransport):
+    """Send every request to the fake IdP, whatever host it was addressed to."""
+
+    def __init__(self, idp_url: str):
+        self.target = httpx.URL(idp_url)
+        self.transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        request.url = request.url.copy_with(scheme=self.target.scheme, host=self.target.host, port=self.target.port)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def current_rss_kb() -> int:
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+def worker_env(args, stub_url: str, idp_url: str, log_dir: str) -> Dict[str, str]:
+    return {
+        "API_CLIENT_URL": stub_url,
+        "REDIRECT_PATH": "/auth/callback",
+        "SESSION_STORE": "memory",
+        "SESSION_SECRET": "load-test-secret",
+        "RESPONSE_CACHE_ENABLED": "true" if args.cache else "false",
+        "API_CLIENT_STREAMING": "false",
+        "BACKEND_MAX_CONCURRENCY": str(args.backend_concurrency),
+        "BACKEND_MAX_QUEUE": str(args.users),
+        "OAUTH_AZURE_AD_CLIENT_ID": "client",
+        "OAUTH_AZURE_AD_CLIENT_SECRET": "secret",
+        "OAUTH_AZURE_AD_TENANT_ID": "tenant",
+        "LOG_FILE": os.path.join(log_dir, f"worker-{os.getpid()}.log"),
+    }
+
+
+async def run_users(worker: int, users: int, args, idp_url: str) -> Dict:
+    import chainlit as cl
+    from chainlit.context import init_ws_context
+    from chainlit.session import WebsocketSession
+
+    import app
+    import oauth_providers
+
+    provider = oauth_providers.AzureADOAuthProvider()
+    provider.http_client = httpx.AsyncClient(transport=FakeIdPTransport(idp_url))
+
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    events: Counter = Counter()
+    errors: Counter = Counter()
+
+    async def emit(event: str, data) -> None:
+        events[event] += 1
+        if event == "new_message" and isinstance(data, dict) and "⚠️" in (data.get("output") or ""):
+            errors["error_message"] += 1
+
+    async def emit_call(*_args, **_kwargs):
+        return None
+
+    async def timed(step: str, coro) -> None:
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            errors[f"{step}:{type(e).__name__}"] += 1
+        latencies[step].append(time.perf_counter() - started)
+
+    async def login() -> str:
+        token = await provider.get_token("code", "http://localhost/auth/callback")
+        azure_user, _ = await provider.get_user_info(token)
+        session_id = app.new_session_id()
+        # Same record the OAuth callback writes, so on_chat_start takes the logged-in path
+        await asyncio.to_thread(
+            app.session_store.set, f"user:{session_id}", {"user_email": azure_user["userPrincipalName"]}, app.SESSION_TTL
+        )
+        return f"{app.SESSION_COOKIE}={app.session_signer.sign(session_id)}"
+
+    async def simulate_user(index: int) -> None:
+        cookie_holder = {}
+
+        async def do_login():
+            cookie_holder["cookie"] = await login()
+
+        await timed("login", do_login())
+        session = WebsocketSession(
+            id=str(uuid.uuid4()),
+            socket_id=f"load-{worker}-{index}",
+            emit=emit,
+            emit_call=emit_call,
+            user_env={},
+            client_type="webapp",
+            http_cookie=cookie_holder.get("cookie"),
+        )
+        init_ws_context(session)
+        try:
+            await timed("chat_start", app.start())
+            for click in range(args.starters):
+                starter = app.STARTER_QUESTIONS[(index + click) % len(app.STARTER_QUESTIONS)]
+                action = cl.Action(name="ask_question", payload={"question": starter["question"]}, label=starter["title"])
+                await timed("action", app.on_action(action))
+            for turn in range(args.turns):
+                message = cl.Message(content=f"User {worker}-{index} question {turn}: how is AIDW used?", type="user_message")
+                await timed("message", app.on_message(message))
+        finally:
+            session.delete()
+
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(args.ramp_concurrency or users)
+
+    async def ramped(index: int):
+        async with semaphore:
+            await simulate_user(index)
+
+    await asyncio.gather(*(ramped(i) for i in range(users)))
+    elapsed = time.perf_counter() - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+
+    await app.api_client.aclose()
+    await provider.http_client.aclose()
+    await oauth_providers.close_http_client()
+
+    return {
+        "worker": worker,
+        "pid": os.getpid(),
+        "users": users,
+        "elapsed_s": elapsed,
+        "cpu_user_s": usage_after.ru_utime - usage_before.ru_utime,
+        "cpu_system_s": usage_after.ru_stime - usage_before.ru_stime,
+        "rss_kb": current_rss_kb(),
+        "max_rss_kb": usage_after.ru_maxrss,
+        "latencies": dict(latencies),
+        "events": dict(events),
+        "errors": dict(errors),
+        "backend": app.api_client.stats(),
+    }
+
+
+def worker_main(worker: int, users: int, args, stub_url: str, idp_url: str, log_dir: str, results) -> None:
+    os.environ.update(worker_env(args, stub_url, idp_url, log_dir))
+    os.chdir(ROOT)
+    try:
+        results.put(asyncio.run(run_users(worker, users, args, idp_url)))
+    except Exception as e:
+        results.put({"worker": worker, "failed": f"{type(e).__name__}: {e}"})
+
+
+def summarize(args, workers: List[Dict]) -> Dict:
+    elapsed = max(w["elapsed_s"] for w in workers)
+    merged: Dict[str, List[float]] = defaultdict(list)
+    for w in workers:
+        for step, samples in w["latencies"].items():
+            merged[step].extend(samples)
+
+    steps = {}
+    for step in STEPS:
+        samples = merged.get(step)
+        if not samples:
+            continue
+        steps[step] = {
+            "count": len(samples),
+            "per_s": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 50) * 1000, 2),
+            "p95_ms": round(percentile(samples, 95) * 1000, 2),
+            "p99_ms": round(percentile(samples, 99) * 1000, 2),
+        }
+
+    errors: Counter = Counter()
+    for w in workers:
+        errors.update(w["errors"])
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "backend_calls_per_s": round(sum(w["backend"]["requests"] for w in workers) / elapsed, 1),
+        "steps": steps,
+        "errors": dict(errors),
+        "workers": [
+            {
+                "worker": w["worker"],
+                "cpu_s": round(w["cpu_user_s"] + w["cpu_system_s"], 3),
+                "cpu_util": round((w["cpu_user_s"] + w["cpu_system_s"]) / w["elapsed_s"], 3),
+                "rss_mb": round(w["rss_kb"] / 1024, 1),
+                "max_rss_mb": round(w["max_rss_kb"] / 1024, 1),
+            }
+            for w in sorted(workers, key=lambda w: w["worker"])
+        ],
+    }
+
+
+def print_summary(summary: Dict, baseline: Dict = None) -> None:
+    print(f"elapsed {summary['elapsed_s']}s, backend calls/s {summary['backend_calls_per_s']}")
+    for step, stats in summary["steps"].items():
+        line = (
+            f"{step:<11} n={stats['count']:<6} {stats['per_s']:>8}/s  p50={stats['p50_ms']:>8}ms  "
+            f"p95={stats['p95_ms']:>8}ms  p99={stats['p99_ms']:>8}ms"
+        )
+        previous = (baseline or {}).get("steps", {}).get(step)
+        if previous:
+            delta = (stats["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"] * 100 if previous["p95_ms"] else 0
+            line += f"  (p95 {delta:+.1f}% vs baseline)"
+        print(line)
+    for w in summary["workers"]:
+        print(f"worker {w['worker']}: cpu {w['cpu_s']}s ({w['cpu_util'] * 100:.0f}%), "
+              f"rss {w['rss_mb']}MB, max rss {w['max_rss_mb']}MB")
+    if summary["errors"]:
+        print(f"errors: {summary['errors']}")
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(args):
+    stub = StubRAGServer(
+        latency=args.latency,
+        payload=build_answer(args.answer_size, args.citations, args.visualizations),
+    ).start()
+    idp = FakeIdPServer(latency=args.idp_latency).start()
+
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    shares = [args.users // args.workers + (1 if i < args.users % args.workers else 0) for i in range(args.workers)]
+    with tempfile.TemporaryDirectory() as log_dir:
+        processes = [
+            ctx.Process(target=worker_main, args=(i, share, args, stub.url, idp.url, log_dir, results))
+            for i, share in enumerate(shares)
+            if share
+        ]
+        for process in processes:
+            process.start()
+        workers = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+
+    stub.shutdown()
+    idp.shutdown()
+
+    failed = [w for w in workers if "failed" in w]
+    if failed:
+        for w in failed:
+            print(f"worker {w['worker']} failed: {w['failed']}")
+        sys.exit(1)
+
+    commit = git_commit()
+    summary = summarize(args, workers)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+    print_summary(summary, baseline)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"load_test_{commit[:8]}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                "config": vars(args),
+                "summary": summary,
+                "workers": [{k: v for k, v in w.items() if k != "latencies"} for w in workers],
+            },
+            f,
+            indent=2,
+        )
+    print(f"results written to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--starters", type=int, default=1, help="starter clicks per user")
+    parser.add_argument("--turns", type=int, default=3, help="messages per user")
+    parser.add_argument("--ramp-concurrency", type=int, default=0, help="max users active at once per worker")
+    parser.add_argument("--latency", type=float, default=0.2, help="stub backend latency in seconds")
+    parser.add_argument("--idp-latency", type=float, default=0.02)
+    parser.add_argument("--answer-size", type=int, default=4096)
+    parser.add_argument("--citations", type=int, default=5)
+    parser.add_argument("--visualizations", type=int, default=1)
+    parser.add_argument("--backend-concurrency", type=int, default=16)
+    parser.add_argument("--cache", action="store_true", help="leave the response cache enabled")
+    parser.add_argument("--output", help="result file, defaults to benchmarks/results/load_test_<commit>.json")
+    parser.add_argument("--compare", help="earlier result file to compare p95 latency against")
+    main(parser.parse_args())
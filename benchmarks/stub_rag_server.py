@@ -0,0 +1,83 @@
+"""Local stand-in for the RAG backend behind API_CLIENT_URL."""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+
+VISUALIZATION_MARKERS = [
+    '{chart:{"title": "Share", "data": [{"label": "A", "value": 40}, {"label": "B", "value": 60}]}}',
+    '{table:{"headers": ["Name", "Value"], "rows": [["alpha", 1], ["beta", 2], ["gamma", 3]]}}',
+    '{flowchart:{"nodes": [{"id": "A", "label": "Start"}, {"id": "B", "label": "End"}], '
+    '"edges": [{"from": "A", "to": "B"}]}}',
+]
+
+
+def build_answer(answer_size: int = 1024, citations: int = 3, visualizations: int = 0) -> Dict:
+    text = ("Lorem ipsum dolor sit amet. " * (answer_size // 28 + 1))[:answer_size]
+    if visualizations:
+        markers = [VISUALIZATION_MARKERS[i % len(VISUALIZATION_MARKERS)] for i in range(visualizations)]
+        text = "\n\n".join([text] + markers)
+    return {
+        "answer": text,
+        "citation": [f"docs/case_study_{i}__v1.pdf" for i in range(citations)],
+        "hyperlink": [f"https://example.com/docs/case study {i}.pdf" for i in range(citations)],
+    }
+
+
+class StubRAGHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        body = self.server.payload
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubRAGServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, payload: Optional[Dict] = None):
+        super().__init__((host, port), StubRAGHandler)
+        self.latency = latency
+        self.payload = json.dumps(payload or build_answer()).encode("utf-8")
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "StubRAGServer":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a stub RAG backend")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--answer-size", type=int, default=1024)
+    parser.add_argument("--citations", type=int, default=3)
+    parser.add_argument("--visualizations", type=int, default=0)
+    args = parser.parse_args()
+
+    server = StubRAGServer(
+        port=args.port,
+        latency=args.latency,
+        payload=build_answer(args.answer_size, args.citations, args.visualizations),
+    )
+    print(f"Stub RAG backend listening on {server.url}")
+    server.serve_forever()
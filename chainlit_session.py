@@ -3,6 +3,7 @@ import json
 import mimetypes
 import shutil
 import uuid
+from json.encoder import encode_basestring_ascii
 from typing import TYPE_CHECKING, Any, Callable, Deque, Dict, Literal, Optional, Union
 
 import aiofiles
@@ -18,23 +19,160 @@ ClientType = Literal["webapp", "copilot", "teams", "slack", "discord"]
 
 class JSONEncoderIgnoreNonSerializable(json.JSONEncoder):
     def default(self, o):
+        if hasattr(o, "to_persistable"):
+            return o.to_persistable()
         try:
             return super().default(o)
         except TypeError:
             return None
 
-def clean_metadata(metadata: Dict, max_size: int = 1048576):
-    cleaned_metadata = json.loads(
-        json.dumps(metadata, cls=JSONEncoderIgnoreNonSerializable, ensure_ascii=False)
-    )
-
-    metadata_size = len(json.dumps(cleaned_metadata).encode("utf-8"))
-    if metadata_size > max_size:
-        cleaned_metadata = {
-            "message": f"Metadata size exceeds the limit of {max_size} bytes. Redacted."
-        }
-
-    return cleaned_metadata
+TRUNCATION_MARKER = "... [truncated]"
+
+def json_key(key: Any) -> Optional[str]:
+    """The string json.dumps would write for a dict key, or None if it would reject it."""
+    if isinstance(key, str):
+        return key
+    if key is None or isinstance(key, (bool, int, float)):
+        return json.dumps(key)
+    return None
+
+def encoded_str_size(value: str) -> int:
+    """Bytes json.dumps writes for a string, quotes and escapes included."""
+    if value.isascii() and value.isprintable() and '"' not in value and "\\" not in value:
+        return len(value) + 2
+    return len(encode_basestring_ascii(value))
+
+class SizeBoundedSanitizer:
+    """Copy a value into JSON-safe types in one pass while counting its encoded size.
+
+    Strings and numbers are shared rather than copied. Objects exposing
+    ``to_persistable`` are replaced by its result and anything else that JSON
+    cannot represent becomes None, as with JSONEncoderIgnoreNonSerializable.
+    Once ``limit`` bytes are reached strings are cut short and containers stop
+    taking items. Sizes are those of the json.dumps output, escapes included.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.size = 0
+        self.truncated = False
+        self._active: set = set()
+
+    def clean(self, value: Any) -> Any:
+        kind = type(value)
+        if kind is str:
+            return self._clean_str(value)
+        if value is None or kind is bool:
+            self.size += 5
+            return value
+        if kind is int or kind is float:
+            self.size += len(repr(value))
+            return value
+        if isinstance(value, dict):
+            return self._clean_container(value, {})
+        if isinstance(value, (list, tuple)):
+            return self._clean_container(value, [])
+        if hasattr(value, "to_persistable"):
+            return self.clean(value.to_persistable())
+        if isinstance(value, str):
+            return self._clean_str(str(value))
+        if isinstance(value, (int, float)):
+            return self.clean(int(value) if isinstance(value, int) else float(value))
+        self.size += 4
+        return None
+
+    def _clean_str(self, value: str) -> str:
+        size = encoded_str_size(value)
+        if self.size + size <= self.limit:
+            self.size += size
+            return value
+        self.truncated = True
+        room = self.limit - self.size - 2 - len(TRUNCATION_MARKER)
+        self.size = self.limit
+        if room <= 0:
+            return TRUNCATION_MARKER
+        # Every character takes at least one byte, so shrink until the escaped prefix fits
+        prefix = value[:room]
+        size = encoded_str_size(prefix) - 2
+        while size > room:
+            prefix = prefix[:len(prefix) * room // size]
+            size = encoded_str_size(prefix) - 2
+        return prefix + TRUNCATION_MARKER
+
+    def _clean_container(self, value, out):
+        # A container that contains itself would never finish encoding
+        if id(value) in self._active:
+            self.size += 4
+            return None
+        self._active.add(id(value))
+        self.size += 2
+        try:
+            if isinstance(out, dict):
+                for key, item in value.items():
+                    key = json_key(key)
+                    if key is None:
+                        continue
+                    # The key plus ": " and the ", " before the next item
+                    key_size = encoded_str_size(key) + 4
+                    if self.size + key_size >= self.limit:
+                        self.truncated = True
+                        break
+                    self.size += key_size
+                    out[key] = self.clean(item)
+            else:
+                for item in value:
+                    if self.size + 2 >= self.limit:
+                        self.truncated = True
+                        break
+                    self.size += 2
+                    out.append(self.clean(item))
+        finally:
+            self._active.discard(id(value))
+        return out
+
+def clean_metadata(metadata: Dict, max_size: int = 1048576, max_field_size: Optional[int] = None):
+    """Return a JSON-safe copy of a user session that json.dumps writes in at most max_size bytes.
+
+    Oversized fields are truncated on their own instead of redacting the whole
+    session, and their keys are listed under "_truncated". Scalars are counted
+    first, then plain containers, then objects with ``to_persistable`` such as
+    the chat history, so the bulky fields cannot crowd out the small ones. Each
+    field is also capped at max_field_size.
+    """
+    # Keys are written the way json.dumps would, so {3: "a"} keeps "3"
+    originals = {json_key(key): key for key in metadata}
+    originals.pop(None, None)
+    cleaned: Dict[str, Any] = dict.fromkeys(originals)
+    truncated = []
+
+    # Leave room for the "_truncated" list and for the last scalar written
+    # when the limit is hit, which is never cut short
+    max_size -= len('"_truncated": []') + sum(encoded_str_size(key) + 2 for key in cleaned) + 32
+    max_field_size = max_field_size or max_size
+    sanitizer = SizeBoundedSanitizer(max_size)
+
+    def weight(key: str) -> int:
+        value = metadata[originals[key]]
+        if hasattr(value, "to_persistable"):
+            return 2
+        return 1 if isinstance(value, (dict, list, tuple)) else 0
+
+    sanitizer.size += 2
+    for key in sorted(cleaned, key=weight):
+        key_size = encoded_str_size(key) + 4
+        if sanitizer.size + key_size >= max_size:
+            del cleaned[key]
+            truncated.append(key)
+            continue
+        sanitizer.size += key_size
+        sanitizer.limit = min(max_size, sanitizer.size + max_field_size)
+        sanitizer.truncated = False
+        cleaned[key] = sanitizer.clean(metadata[originals[key]])
+        if sanitizer.truncated:
+            truncated.append(key)
+    if truncated:
+        cleaned["_truncated"] = truncated
+    return cleaned
 
 class BaseSession:
     """Base object."""
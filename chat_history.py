@@ -0,0 +1,132 @@
+import hashlib
+import json
+import logging
+from typing import Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+Summarizer = Callable[[List[Dict[str, str]]], Awaitable[str]]
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text, plus per-message overhead
+    return len(text) // 4 + 4
+
+
+def encode_message(role: str, content: str) -> str:
+    return json.dumps({"role": role, "content": content})
+
+
+class HistoryWindow(list):
+    """Messages for one request, carrying their JSON encoding and a fingerprint.
+
+    Behaves as a plain list of messages, so callers that do not know about the
+    cached encoding keep working.
+    """
+
+    def __init__(self, messages: List[Dict[str, str]], fragments: List[str], digests: List[bytes]):
+        super().__init__(messages)
+        self.json = "[" + ", ".join(fragments) + "]"
+        self.fingerprint = hashlib.sha256(b"".join(digests)).hexdigest() if digests else ""
+
+
+class ChatHistory:
+    """Conversation turns kept for the backend, bounded by a token budget.
+
+    Each assistant turn keeps the raw backend answer, which is what gets sent
+    back as context, separately from the rendered markdown shown in the chat.
+    Turns are append-only; each one is JSON-encoded, hashed and costed once
+    when it is added, so building the next request only joins cached pieces.
+    """
+
+    def __init__(self, token_budget: int = 3000, summarizer: Optional[Summarizer] = None):
+        self.token_budget = token_budget
+        self.summarizer = summarizer
+        self.summary: Optional[str] = None
+        self.turns: List[Dict[str, str]] = []
+        self._messages: List[Dict[str, str]] = []
+        self._fragments: List[str] = []
+        self._digests: List[bytes] = []
+        self._tokens: List[int] = []
+        self._summary_cache: Optional[tuple] = None
+
+    def _append(self, message: Dict[str, str]) -> None:
+        fragment = encode_message(message["role"], message["content"])
+        self.turns.append(message)
+        self._messages.append({"role": message["role"], "content": message["content"]})
+        self._fragments.append(fragment)
+        self._digests.append(hashlib.blake2b(fragment.encode("utf-8"), digest_size=16).digest())
+        self._tokens.append(estimate_tokens(message["content"]))
+
+    def _drop(self, count: int) -> None:
+        del self.turns[:count]
+        del self._messages[:count]
+        del self._fragments[:count]
+        del self._digests[:count]
+        del self._tokens[:count]
+
+    def add_turn(self, question: str, answer: str, rendered: str) -> None:
+        self._append({"role": "user", "content": question})
+        self._append({"role": "assistant", "content": answer, "rendered": rendered})
+
+    def _summary_message(self) -> List[Dict[str, str]]:
+        if not self.summary:
+            return []
+        return [{"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"}]
+
+    def _summary_parts(self) -> tuple:
+        """(messages, fragments, digests, tokens) for the summary, encoded once per summary."""
+        if self._summary_cache is None or self._summary_cache[0] != self.summary:
+            messages = self._summary_message()
+            fragments = [encode_message(m["role"], m["content"]) for m in messages]
+            digests = [hashlib.blake2b(f.encode("utf-8"), digest_size=16).digest() for f in fragments]
+            tokens = sum(estimate_tokens(m["content"]) for m in messages)
+            self._summary_cache = (self.summary, messages, fragments, digests, tokens)
+        return self._summary_cache[1:]
+
+    def _split(self) -> int:
+        """Return the index of the oldest turn that still fits in the budget."""
+        budget = self.token_budget - self._summary_parts()[3]
+        index = len(self.turns)
+        while index > 0:
+            cost = self._tokens[index - 1]
+            if cost > budget:
+                break
+            budget -= cost
+            index -= 1
+        # Never start the window on an assistant reply without its question
+        if index < len(self.turns) and self.turns[index]["role"] == "assistant":
+            index += 1
+        return index
+
+    def window(self) -> HistoryWindow:
+        """Messages to send with the next request, oldest first."""
+        split = self._split()
+        messages, fragments, digests, _ = self._summary_parts()
+        return HistoryWindow(
+            messages + self._messages[split:],
+            fragments + self._fragments[split:],
+            digests + self._digests[split:],
+        )
+
+    async def compact(self) -> None:
+        """Drop turns that fell out of the budget, folding them into the summary if possible."""
+        split = self._split()
+        if split == 0:
+            return
+        if self.summarizer is None:
+            self._drop(split)
+            return
+        older = self._summary_message() + self._messages[:split]
+        try:
+            self.summary = await self.summarizer(older)
+        except Exception as e:
+            # The answer is already out; losing the older turns beats an error message
+            logger.error(f"Chat history summarizer failed, truncating instead: {str(e)}")
+        self._drop(split)
+
+    def to_persistable(self) -> Dict:
+        return {"summary": self.summary, "turns": self.turns}
+
+    def __len__(self) -> int:
+        return len(self.turns)
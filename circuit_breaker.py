@@ -0,0 +1,136 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+from metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker shared by every request to one backend.
+
+    The circuit opens once at least ``min_calls`` outcomes were recorded in the
+    last ``window`` seconds and the share of failures reaches
+    ``failure_threshold``. After ``reset_timeout`` seconds a limited number of
+    probe requests are let through; one success closes it again, one failure
+    reopens it. Callers must call ``release`` once an allowed call is over so
+    a probe that ended without an outcome (a client error, a cancel) gives
+    its slot back instead of wedging the circuit half-open. Callers that
+    fail fast on ``is_open`` without asking ``allow_request`` report it with
+    ``reject``.
+    """
+
+    def __init__(
+        self,
+        failure_threshold: float = 0.5,
+        min_calls: int = 10,
+        window: float = 60.0,
+        reset_timeout: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.failure_threshold = failure_threshold
+        self.min_calls = min_calls
+        self.window = window
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.times_opened = 0
+        self.rejections = Counter("aidw_circuit_rejections", "Backend requests refused by the open circuit")
+        self.state_gauge = Gauge(
+            "aidw_circuit_state", "1 for the current backend circuit state", labelnames=("state",)
+        )
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._set_state_gauge()
+
+    @property
+    def rejected(self) -> int:
+        return int(self.rejections.values.get((), 0))
+
+    def _set_state_gauge(self) -> None:
+        for state in (CLOSED, OPEN, HALF_OPEN):
+            self.state_gauge.set(1 if state == self.state else 0, state=state)
+
+    def _trim(self, now: float) -> None:
+        while self._outcomes and self._outcomes[0][0] < now - self.window:
+            self._outcomes.popleft()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Circuit breaker {self.state} -> {state}")
+            self.state = state
+            self._set_state_gauge()
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+        if state in (OPEN, HALF_OPEN):
+            self.half_open_calls = 0
+        if state == CLOSED:
+            self._outcomes.clear()
+
+    @property
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at < self.reset_timeout
+
+    def allow_request(self) -> bool:
+        if self.state == OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.reject()
+                return False
+            self._transition(HALF_OPEN)
+
+        if self.state == HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.reject()
+                return False
+            self.half_open_calls += 1
+
+        return True
+
+    def reject(self) -> None:
+        self.rejections.inc()
+
+    def release(self) -> None:
+        # After a recorded outcome the circuit has left HALF_OPEN, so this is a no-op
+        if self.state == HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def record_success(self) -> None:
+        if self.state == HALF_OPEN:
+            self._transition(CLOSED)
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, True))
+        self._trim(now)
+
+    def record_failure(self) -> None:
+        if self.state == HALF_OPEN:
+            self._transition(OPEN)
+            return
+        now = time.monotonic()
+        self._outcomes.append((now, False))
+        self._trim(now)
+        if self.state == CLOSED and len(self._outcomes) >= self.min_calls:
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if failures / len(self._outcomes) >= self.failure_threshold:
+                self._transition(OPEN)
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "window_calls": len(self._outcomes),
+            "window_failures": failures,
+            "failure_rate": round(failures / len(self._outcomes), 4) if self._outcomes else 0.0,
+            "times_opened": self.times_opened,
+            "rejected": self.rejected,
+        }
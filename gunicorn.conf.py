@@ -0,0 +1,15 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import log_pipeline  # noqa: E402
+
+
+def on_starting(server):
+    # Workers forked after this inherit the queue and send records to one writer
+    log_pipeline.start_log_process()
+
+
+def on_exit(server):
+    log_pipeline.stop_log_process()
@@ -0,0 +1,197 @@
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import queue
+import secrets
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+# Set in the gunicorn master by start_log_process and inherited by forked workers
+_shared_queue: Optional[multiprocessing.Queue] = None
+_log_process: Optional[multiprocessing.Process] = None
+
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def new_request_id() -> str:
+    return secrets.token_hex(8)
+
+
+class RequestIdFilter(logging.Filter):
+    """Stamp each record with the request id of the task that logged it."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class ErrorSampler(logging.Filter):
+    """Let through at most ``burst`` identical errors per ``window`` seconds.
+
+    Errors are identical when they come from the same logging call. The next
+    record let through after a quiet period carries the number suppressed.
+    """
+
+    def __init__(self, burst: int = 10, window: float = 60.0):
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen: Dict[Tuple[str, int], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno < logging.ERROR:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        state = self._seen.get(key)
+        if state is None or now - state[0] >= self.window:
+            suppressed = state[2] if state else 0
+            self._seen[key] = [now, 1, 0]
+            if suppressed:
+                record.suppressed = suppressed
+            return True
+        if state[1] < self.burst:
+            state[1] += 1
+            return True
+        state[2] += 1
+        return False
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+            "pid": record.process,
+        }
+        # Anything passed through ``extra=`` is kept as a structured field
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and key not in entry:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SizedTimedRotatingFileHandler(logging.handlers.TimedRotatingFileHandler):
+    """Rotate on a schedule and also whenever the file grows past ``max_bytes``."""
+
+    def __init__(self, filename: str, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if super().shouldRollover(record):
+            return True
+        if self.max_bytes > 0:
+            if self.stream is None:
+                self.stream = self._open()
+            return self.stream.tell() + len(self.format(record)) + 1 >= self.max_bytes
+        return False
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Several size rollovers can share one time suffix; never overwrite a backup
+        name = super().rotation_filename(default_name)
+        candidate, index = name, 1
+        while os.path.exists(candidate):
+            candidate = f"{name}.{index}"
+            index += 1
+        return candidate
+
+
+def build_handlers(path: str, max_bytes: int, backup_count: int, when: str):
+    file_handler = SizedTimedRotatingFileHandler(
+        path, max_bytes=max_bytes, when=when, backupCount=backup_count, encoding="utf-8", delay=True
+    )
+    file_handler.setFormatter(JSONFormatter())
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s")
+    )
+    return file_handler, console_handler
+
+
+def _settings() -> Dict[str, Any]:
+    return {
+        "path": os.getenv("LOG_FILE", "chatbot.log"),
+        "max_bytes": int(os.getenv("LOG_MAX_BYTES", str(50 * 1024 * 1024))),
+        "backup_count": int(os.getenv("LOG_BACKUP_COUNT", "14")),
+        "when": os.getenv("LOG_ROTATE_WHEN", "midnight"),
+    }
+
+
+def configure_logging(level: int = logging.INFO) -> Optional[logging.handlers.QueueListener]:
+    """Route all logging through a QueueHandler so callers never block on I/O.
+
+    Inside gunicorn workers, records go to the log process started by
+    start_log_process. Otherwise a QueueListener thread in this process does the
+    writing; it is returned so the caller can stop it on shutdown.
+    """
+    listener = None
+    if _shared_queue is not None:
+        log_queue = _shared_queue
+    else:
+        log_queue = queue.SimpleQueue()
+        listener = logging.handlers.QueueListener(log_queue, *build_handlers(**_settings()))
+        listener.start()
+
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    queue_handler.addFilter(
+        ErrorSampler(
+            burst=int(os.getenv("LOG_ERROR_BURST", "10")),
+            window=float(os.getenv("LOG_ERROR_WINDOW", "60")),
+        )
+    )
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    return listener
+
+
+def _run_log_process(log_queue: multiprocessing.Queue, settings: Dict[str, Any]) -> None:
+    handlers = build_handlers(**settings)
+    while True:
+        record = log_queue.get()
+        if record is None:
+            break
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+    for handler in handlers:
+        handler.close()
+
+
+def start_log_process() -> None:
+    """Start one writer process for all workers; call before gunicorn forks them."""
+    global _shared_queue, _log_process
+    if _log_process is not None:
+        return
+    _shared_queue = multiprocessing.Queue(-1)
+    _log_process = multiprocessing.Process(
+        target=_run_log_process, args=(_shared_queue, _settings()), name="log-writer", daemon=True
+    )
+    _log_process.start()
+
+
+def stop_log_process(timeout: float = 5.0) -> None:
+    global _log_process
+    if _log_process is None:
+        return
+    _shared_queue.put(None)
+    _log_process.join(timeout)
+    _log_process = None
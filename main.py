@@ -1,6 +1,8 @@
 from fastapi import FastAPI, Request
 from fastapi.responses import RedirectResponse, HTMLResponse
-import msal
+from msal_client import MSALClient
+from session_store import SESSION_COOKIE, SessionSigner, build_session_store, new_session_id
+import asyncio
 import os
 import base64
 import hashlib
@@ -21,13 +23,20 @@ REDIRECT_PATH = os.getenv("REDIRECT_PATH")
 if REDIRECT_PATH is None:
     raise ValueError("REDIRECT_PATH environment variable is not set")
 SCOPE = ["User.Read"]
-SESSION = {}
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+PKCE_TTL = int(os.getenv("PKCE_TTL", "600"))
+session_store = build_session_store(
+    os.getenv("SESSION_STORE", "sqlite"), os.getenv("SESSION_STORE_PATH", "sessions.sqlite3")
+)
+session_signer = SessionSigner(os.getenv("SESSION_SECRET") or os.getenv("CHAINLIT_AUTH_SECRET"))
 
 # Initialize MSAL application
-msal_app = msal.ConfidentialClientApplication(
+msal_app = MSALClient(
     CLIENT_ID,
     authority=AUTHORITY,
-    client_credential=CLIENT_SECRET
+    client_credential=CLIENT_SECRET,
+    token_cache_path=os.getenv("MSAL_TOKEN_CACHE_PATH"),
+    max_workers=int(os.getenv("MSAL_EXECUTOR_WORKERS", "4")),
 )
 
 def generate_pkce_pair():
@@ -36,40 +45,58 @@ def generate_pkce_pair():
     return code_verifier, code_challenge
 
 @app.get("/")
-async def root():
+async def root(request: Request):
     code_verifier, code_challenge = generate_pkce_pair()
-    SESSION['code_verifier'] = code_verifier
+    session_id = session_signer.unsign(request.cookies.get(SESSION_COOKIE)) or new_session_id()
+    state = session_signer.sign(new_session_id())
+    await asyncio.to_thread(
+        session_store.set, f"pkce:{state}", {"code_verifier": code_verifier, "session_id": session_id}, PKCE_TTL
+    )
     redirect_uri = f"https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net{REDIRECT_PATH}" if os.getenv("ENV") == "production" else f"http://localhost:8000{REDIRECT_PATH}"
-    auth_url = msal_app.get_authorization_request_url(
+    auth_url = await msal_app.get_authorization_request_url(
         SCOPE,
+        state=state,
         redirect_uri=redirect_uri,
         code_challenge=code_challenge,
         code_challenge_method='S256'
     )
-    return RedirectResponse(url=auth_url)
+    response = RedirectResponse(url=auth_url)
+    response.set_cookie(
+        SESSION_COOKIE,
+        session_signer.sign(session_id),
+        max_age=SESSION_TTL,
+        httponly=True,
+        secure=os.getenv("ENV") == "production",
+        samesite="lax",
+    )
+    return response
 
 @app.get(REDIRECT_PATH)
 async def authorized(request: Request):
     code = request.query_params.get('code')
-    code_verifier = SESSION.pop('code_verifier', None)
-    if not code_verifier:
+    state = request.query_params.get('state')
+    pkce = await asyncio.to_thread(session_store.pop, f"pkce:{state}") if session_signer.unsign(state) else None
+    if not pkce:
         return {"error": "Code verifier not found in session."}
     
     redirect_uri = f"https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net{REDIRECT_PATH}" if os.getenv("ENV") == "production" else f"http://localhost:8001{REDIRECT_PATH}"
-    result = msal_app.acquire_token_by_authorization_code(
+    result = await msal_app.acquire_token_by_authorization_code(
         code,
         scopes=SCOPE,
         redirect_uri=redirect_uri,
-        code_verifier=code_verifier
+        code_verifier=pkce['code_verifier']
     )
     if "access_token" in result:
-        SESSION['user_email'] = result.get('id_token_claims', {}).get('preferred_username', 'Unknown')
+        user_email = result.get('id_token_claims', {}).get('preferred_username', 'Unknown')
+        await asyncio.to_thread(session_store.set, f"user:{pkce['session_id']}", {"user_email": user_email}, SESSION_TTL)
         return RedirectResponse(url="https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net" if os.getenv("ENV") == "production" else "http://localhost:8000")
     return {"error": "Authentication failed"}
 
 @app.get("/chainlit")
-async def chainlit():
-    user_email = SESSION.get('user_email', 'Unknown')
+async def chainlit(request: Request):
+    session_id = session_signer.unsign(request.cookies.get(SESSION_COOKIE))
+    session = await asyncio.to_thread(session_store.get, f"user:{session_id}") if session_id else None
+    user_email = session.get('user_email', 'Unknown') if session else 'Unknown'
     return HTMLResponse(f'<meta http-equiv="refresh" content="0;url=https://aidw-assistant-dmdjargjhvh3dqez.eastus2-01.azurewebsites.net/" if os.getenv("ENV") == "production" else "http://localhost:8000/">')
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+import bisect
+import glob
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Labels, float]
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+class Counter:
+    """Monotonic counter, optionally split by label values."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str = "", labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        return [(f"{self.name}_total", labels, value) for labels, value in self.values.items()]
+
+
+class Gauge:
+    """Point-in-time value, either set explicitly or read from a callback on collection."""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str = "",
+        function: Optional[Callable[[], float]] = None,
+        labelnames: Sequence[str] = (),
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.labelnames = tuple(labelnames)
+        self.values: Dict[Labels, float] = {}
+
+    @property
+    def value(self) -> float:
+        return self.values.get((), 0.0)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = tuple((name, str(labels[name])) for name in self.labelnames)
+        self.values[key] = value
+
+    def samples(self) -> List[Sample]:
+        if self.function is not None:
+            return [(self.name, (), float(self.function()))]
+        if not self.labelnames:
+            return [(self.name, (), float(self.value))]
+        return [(self.name, labels, float(value)) for labels, value in self.values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style."""
+
+    type = "histogram"
+
+    def __init__(self, name: str = "", documentation: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets: List[float] = sorted(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + [float("inf")], self.counts):
+            cumulative += count
+            buckets[_format_bound(bound)] = cumulative
+        return {"buckets": buckets, "sum": self.sum, "count": self.count}
+
+    def samples(self) -> List[Sample]:
+        snapshot = self.snapshot()
+        samples: List[Sample] = [
+            (f"{self.name}_bucket", (("le", bound),), count) for bound, count in snapshot["buckets"].items()
+        ]
+        samples.append((f"{self.name}_sum", (), snapshot["sum"]))
+        samples.append((f"{self.name}_count", (), snapshot["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    """Collects metrics for the text exposition format.
+
+    Metrics are plain attributes updated from the event loop, so recording a
+    value costs a dict or list update and takes no locks. With ``multiproc_dir``
+    set, every worker periodically dumps its values to ``<pid>.json`` in that
+    directory and a scrape on any worker merges them all, much like
+    prometheus_client's multiprocess mode.
+    """
+
+    def __init__(self, multiproc_dir: Optional[str] = None):
+        self.multiproc_dir = multiproc_dir
+        self.metrics: List[Any] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str = "", labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str = "", function: Optional[Callable[[], float]] = None) -> Gauge:
+        return self.register(Gauge(name, documentation, function))
+
+    def histogram(self, name: str, documentation: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, buckets))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            metric.name: {
+                "type": metric.type,
+                "help": metric.documentation,
+                "samples": [[name, list(labels), value] for name, labels, value in metric.samples()],
+            }
+            for metric in self.metrics
+        }
+
+    def write_snapshot(self) -> None:
+        if not self.multiproc_dir:
+            return
+        path = os.path.join(self.multiproc_dir, f"{os.getpid()}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp_path, path)
+
+    def _worker_snapshots(self) -> Iterable[Tuple[bool, Dict[str, Any]]]:
+        yield True, self.snapshot()
+        if not self.multiproc_dir:
+            return
+        for path in glob.glob(os.path.join(self.multiproc_dir, "*.json")):
+            pid = int(os.path.basename(path)[:-5])
+            if pid == os.getpid():
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {path}: {str(e)}")
+                continue
+            yield _pid_alive(pid), snapshot
+
+    def render(self) -> str:
+        """Render every worker's metrics, summing samples with the same name and labels."""
+        merged: Dict[str, Dict[str, Any]] = {}
+        for alive, snapshot in self._worker_snapshots():
+            for name, metric in snapshot.items():
+                # Gauges describe live state, so exited workers no longer contribute
+                if metric["type"] == "gauge" and not alive:
+                    continue
+                entry = merged.setdefault(name, {"type": metric["type"], "help": metric["help"], "samples": {}})
+                for sample_name, labels, value in metric["samples"]:
+                    key = (sample_name, tuple(tuple(pair) for pair in labels))
+                    entry["samples"][key] = entry["samples"].get(key, 0.0) + value
+
+        lines = []
+        for name, entry in merged.items():
+            lines.append(f"# HELP {name} {entry['help']}")
+            lines.append(f"# TYPE {name} {entry['type']}")
+            for (sample_name, labels), value in entry["samples"].items():
+                if labels:
+                    label_text = ",".join(f'{key}="{_escape(label)}"' for key, label in labels)
+                    sample_name = f"{sample_name}{{{label_text}}}"
+                lines.append(f"{sample_name} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
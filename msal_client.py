@@ -0,0 +1,73 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+import msal
+
+
+def build_token_cache(path: Optional[str] = None) -> msal.SerializableTokenCache:
+    """Return a token cache, persisted to a file shared by all workers when a path is given."""
+    if not path:
+        return msal.SerializableTokenCache()
+    # msal-extensions guards the file with a cross-process lock
+    from msal_extensions import FilePersistence, PersistedTokenCache
+
+    return PersistedTokenCache(FilePersistence(path))
+
+
+class MSALClient:
+    """Runs blocking MSAL calls on a bounded executor instead of the event loop.
+
+    The ConfidentialClientApplication is created on first use, inside the
+    executor, because construction performs OpenID metadata discovery. The
+    discovery responses are kept in ``http_cache`` and reused afterwards.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        authority: str,
+        client_credential: str,
+        token_cache_path: Optional[str] = None,
+        max_workers: int = 4,
+    ):
+        self.client_id = client_id
+        self.authority = authority
+        self.client_credential = client_credential
+        self.token_cache = build_token_cache(token_cache_path)
+        self.http_cache: Dict[Any, Any] = {}
+        self._app: Optional[msal.ConfidentialClientApplication] = None
+        self._app_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="msal")
+
+    def _get_app(self) -> msal.ConfidentialClientApplication:
+        if self._app is None:
+            # The first calls can arrive on several executor threads at once; discover only once
+            with self._app_lock:
+                if self._app is None:
+                    self._app = msal.ConfidentialClientApplication(
+                        self.client_id,
+                        authority=self.authority,
+                        client_credential=self.client_credential,
+                        token_cache=self.token_cache,
+                        http_cache=self.http_cache,
+                    )
+        return self._app
+
+    async def _run(self, method: str, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+
+        def call():
+            return getattr(self._get_app(), method)(*args, **kwargs)
+
+        return await loop.run_in_executor(self._executor, call)
+
+    async def get_authorization_request_url(self, scopes: List[str], **kwargs) -> str:
+        return await self._run("get_authorization_request_url", scopes, **kwargs)
+
+    async def acquire_token_by_authorization_code(self, code: str, scopes: List[str], **kwargs) -> Dict[str, Any]:
+        return await self._run("acquire_token_by_authorization_code", code, scopes=scopes, **kwargs)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
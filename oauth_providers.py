@@ -1,13 +1,88 @@
+import asyncio
 import base64
+import json
 import os
+import time
 import urllib.parse
-from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple, Type
 
 import httpx
 from fastapi import HTTPException
 
 from chainlit.secret import random_secret
 from chainlit.user import User
+from token_refresh import TokenSet, token_store
+
+
+class PerHostTransport(httpx.AsyncBaseTransport):
+    """Route requests to one keep-alive connection pool per identity host."""
+
+    def __init__(self, limits: httpx.Limits, http2: bool = False):
+        self.limits = limits
+        self.http2 = http2
+        self._transports: Dict[Tuple[bytes, bytes, Optional[int]], httpx.AsyncHTTPTransport] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        key = (request.url.raw_scheme, request.url.raw_host, request.url.port)
+        transport = self._transports.get(key)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2)
+            self._transports[key] = transport
+        return await transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        for transport in self._transports.values():
+            await transport.aclose()
+        self._transports.clear()
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the application-wide client shared by every OAuth provider."""
+    global _http_client
+
+    if _http_client is None or _http_client.is_closed:
+        limits = httpx.Limits(
+            max_connections=int(os.environ.get("OAUTH_HTTP_MAX_CONNECTIONS_PER_HOST", "20")),
+            max_keepalive_connections=int(
+                os.environ.get("OAUTH_HTTP_MAX_KEEPALIVE_PER_HOST", "10")
+            ),
+            keepalive_expiry=float(os.environ.get("OAUTH_HTTP_KEEPALIVE_EXPIRY", "60")),
+        )
+        _http_client = httpx.AsyncClient(
+            transport=PerHostTransport(limits),
+            timeout=httpx.Timeout(float(os.environ.get("OAUTH_HTTP_TIMEOUT", "10"))),
+        )
+    return _http_client
+
+
+async def close_http_client() -> None:
+    global _http_client
+
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+# Token responses waiting for get_user_info, keyed by access token. Keeping them
+# here instead of on the shared provider instance avoids mixing up concurrent logins.
+_pending_token_responses: "OrderedDict[str, Dict]" = OrderedDict()
+_MAX_PENDING_TOKEN_RESPONSES = 1024
+
+
+def remember_token_response(access_token: str, response: Dict) -> None:
+    _pending_token_responses[access_token] = response
+    while len(_pending_token_responses) > _MAX_PENDING_TOKEN_RESPONSES:
+        _pending_token_responses.popitem(last=False)
+
+
+def store_user_tokens(user_id: str, provider_id: str, access_token: str) -> None:
+    response = _pending_token_responses.pop(access_token, None)
+    if response is not None:
+        token_store.set(user_id, TokenSet.from_response(provider_id, response))
 
 
 class OAuthProvider:
@@ -18,9 +93,20 @@ class OAuthProvider:
     authorize_url: str
     authorize_params: Dict[str, str]
     default_prompt: Optional[str] = None
+    _http_client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """Injected client if one was set, otherwise the shared application pool."""
+        return self._http_client or get_http_client()
+
+    @http_client.setter
+    def http_client(self, client: httpx.AsyncClient):
+        self._http_client = client
 
-    def is_configured(self):
-        return all([os.environ.get(env) for env in self.env])
+    @classmethod
+    def is_configured(cls):
+        return all([os.environ.get(env) for env in cls.env])
 
     async def get_token(self, code: str, url: str) -> str:
         raise NotImplementedError
@@ -28,6 +114,23 @@ class OAuthProvider:
     async def get_user_info(self, token: str) -> Tuple[Dict[str, str], User]:
         raise NotImplementedError
 
+    async def refresh_access_token(self, refresh_token: str) -> Dict:
+        """Exchange a refresh token for a new token response."""
+        token_url = getattr(self, "token_url", None)
+        if not token_url:
+            raise NotImplementedError
+        response = await self.http_client.post(
+            token_url,
+            data={
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+                "grant_type": "refresh_token",
+                "refresh_token": refresh_token,
+            },
+        )
+        response.raise_for_status()
+        return response.json()
+
     def get_env_prefix(self) -> str:
         """Return environment prefix, like AZURE_AD."""
 
@@ -65,42 +168,42 @@ class GithubOAuthProvider(OAuthProvider):
             "client_secret": self.client_secret,
             "code": code,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://github.com/login/oauth/access_token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            "https://github.com/login/oauth/access_token",
+            data=payload,
+        )
+        response.raise_for_status()
+        content = urllib.parse.parse_qs(response.text)
+        token = content.get("access_token", [""])[0]
+        if not token:
+            raise HTTPException(
+                status_code=400, detail="Failed to get the access token"
             )
-            response.raise_for_status()
-            content = urllib.parse.parse_qs(response.text)
-            token = content.get("access_token", [""])[0]
-            if not token:
-                raise HTTPException(
-                    status_code=400, detail="Failed to get the access token"
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            user_response = await client.get(
-                "https://api.github.com/user",
-                headers={"Authorization": f"token {token}"},
-            )
-            user_response.raise_for_status()
-            github_user = user_response.json()
+        client = self.http_client
+        user_response = await client.get(
+            "https://api.github.com/user",
+            headers={"Authorization": f"token {token}"},
+        )
+        user_response.raise_for_status()
+        github_user = user_response.json()
 
-            emails_response = await client.get(
-                "https://api.github.com/user/emails",
-                headers={"Authorization": f"token {token}"},
-            )
-            emails_response.raise_for_status()
-            emails = emails_response.json()
+        emails_response = await client.get(
+            "https://api.github.com/user/emails",
+            headers={"Authorization": f"token {token}"},
+        )
+        emails_response.raise_for_status()
+        emails = emails_response.json()
 
-            github_user.update({"emails": emails})
-            user = User(
-                identifier=github_user["login"],
-                metadata={"image": github_user["avatar_url"], "provider": "github"},
-            )
-            return (github_user, user)
+        github_user.update({"emails": emails})
+        user = User(
+            identifier=github_user["login"],
+            metadata={"image": github_user["avatar_url"], "provider": "github"},
+        )
+        return (github_user, user)
 
 
 class GoogleOAuthProvider(OAuthProvider):
@@ -128,35 +231,153 @@ class GoogleOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                "https://oauth2.googleapis.com/token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            "https://oauth2.googleapis.com/token",
+            data=payload,
+        )
+        response.raise_for_status()
+        json = response.json()
+        token = json.get("access_token")
+        if not token:
+            raise httpx.HTTPStatusError(
+                "Failed to get the access token",
+                request=response.request,
+                response=response,
             )
-            response.raise_for_status()
-            json = response.json()
-            token = json.get("access_token")
-            if not token:
-                raise httpx.HTTPStatusError(
-                    "Failed to get the access token",
-                    request=response.request,
-                    response=response,
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://www.googleapis.com/userinfo/v2/me",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-            google_user = response.json()
-            user = User(
-                identifier=google_user["email"],
-                metadata={"image": google_user["picture"], "provider": "google"},
-            )
-            return (google_user, user)
+        client = self.http_client
+        response = await client.get(
+            "https://www.googleapis.com/userinfo/v2/me",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        google_user = response.json()
+        user = User(
+            identifier=google_user["email"],
+            metadata={"image": google_user["picture"], "provider": "google"},
+        )
+        return (google_user, user)
+
+
+class AvatarCache:
+    """Encoded Graph profile photos per principal, revalidated by ETag after the TTL."""
+
+    def __init__(self, ttl: float = 3600, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Optional[str], Optional[str]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, principal: str) -> Optional[Tuple[bool, Optional[str], Optional[str]]]:
+        """Return (fresh, etag, data URI) or None when nothing is cached."""
+        entry = self._entries.get(principal)
+        if entry is None:
+            return None
+        self._entries.move_to_end(principal)
+        expires_at, etag, image = entry
+        return (expires_at > time.time(), etag, image)
+
+    def set(self, principal: str, etag: Optional[str], image: Optional[str]) -> None:
+        self._entries[principal] = (time.time() + self.ttl, etag, image)
+        self._entries.move_to_end(principal)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+avatar_cache = AvatarCache(
+    ttl=float(os.environ.get("OAUTH_AZURE_AD_PHOTO_CACHE_TTL", "3600")),
+    max_entries=int(os.environ.get("OAUTH_AZURE_AD_PHOTO_CACHE_SIZE", "1024")),
+)
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def get_token_principal(token: str) -> Optional[str]:
+    """Read the tenant and object id from an access token without verifying it.
+
+    The value is only used as a cache key; tokens that are not JWTs yield None.
+    """
+    try:
+        payload = token.split(".")[1]
+        claims = json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))
+    except Exception:
+        return None
+    if claims.get("oid"):
+        return f"{claims.get('tid', '')}:{claims['oid']}"
+    return claims.get("upn") or claims.get("preferred_username")
+
+
+async def fetch_azure_photo(
+    client: httpx.AsyncClient, token: str, principal: Optional[str], etag: Optional[str] = None
+) -> Optional[str]:
+    headers = {"Authorization": f"Bearer {token}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    cached = avatar_cache.get(principal) if principal else None
+    stale_image = cached[2] if cached else None
+    try:
+        photo_response = await client.get(
+            "https://graph.microsoft.com/v1.0/me/photos/48x48/$value",
+            headers=headers,
+        )
+        if photo_response.status_code == 304 and principal:
+            avatar_cache.set(principal, etag, stale_image)
+            return stale_image
+        if photo_response.status_code == 404:
+            # Users without a photo get a 404; remember that too
+            if principal:
+                avatar_cache.set(principal, None, None)
+            return None
+        if photo_response.status_code != 200:
+            # Throttling, server errors or an expired token say nothing about
+            # the photo; keep serving what we had until Graph answers again
+            return stale_image
+        photo_data = await photo_response.aread()
+        base64_image = base64.b64encode(photo_data)
+        image = f"data:{photo_response.headers['Content-Type']};base64,{base64_image.decode('utf-8')}"
+        if principal:
+            avatar_cache.set(principal, photo_response.headers.get("ETag"), image)
+        return image
+    except Exception:
+        # Ignore errors getting the photo
+        return stale_image
+
+
+async def fetch_azure_user(client: httpx.AsyncClient, token: str) -> Dict:
+    """Fetch /me and the profile photo concurrently, reusing cached photos."""
+    principal = get_token_principal(token)
+    cached = avatar_cache.get(principal) if principal else None
+
+    profile = client.get(
+        "https://graph.microsoft.com/v1.0/me",
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    if cached and cached[0]:
+        response = await profile
+        image = cached[2]
+    elif os.environ.get("OAUTH_AZURE_AD_LAZY_PHOTO"):
+        # Do not hold up the login; the photo is picked up from the cache next time
+        task = asyncio.create_task(
+            fetch_azure_photo(client, token, principal, cached[1] if cached else None)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        response = await profile
+        image = cached[2] if cached else None
+    else:
+        response, image = await asyncio.gather(
+            profile,
+            fetch_azure_photo(client, token, principal, cached[1] if cached else None),
+        )
+
+    response.raise_for_status()
+    azure_user = response.json()
+    if image:
+        azure_user["image"] = image
+    return azure_user
 
 
 class AzureADOAuthProvider(OAuthProvider):
@@ -198,56 +419,34 @@ class AzureADOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.token_url,
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            self.token_url,
+            data=payload,
+        )
+        response.raise_for_status()
+        json = response.json()
+
+        token = json["access_token"]
+        if not token:
+            raise HTTPException(
+                status_code=400, detail="Failed to get the access token"
             )
-            response.raise_for_status()
-            json = response.json()
-
-            token = json["access_token"]
-            refresh_token = json.get("refresh_token")
-            if not token:
-                raise HTTPException(
-                    status_code=400, detail="Failed to get the access token"
-                )
-            self._refresh_token = refresh_token
-            return token
+        remember_token_response(token, json)
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://graph.microsoft.com/v1.0/me",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-
-            azure_user = response.json()
-
-            try:
-                photo_response = await client.get(
-                    "https://graph.microsoft.com/v1.0/me/photos/48x48/$value",
-                    headers={"Authorization": f"Bearer {token}"},
-                )
-                photo_data = await photo_response.aread()
-                base64_image = base64.b64encode(photo_data)
-                azure_user["image"] = (
-                    f"data:{photo_response.headers['Content-Type']};base64,{base64_image.decode('utf-8')}"
-                )
-            except Exception:
-                # Ignore errors getting the photo
-                pass
-
-            user = User(
-                identifier=azure_user["userPrincipalName"],
-                metadata={
-                    "image": azure_user.get("image"),
-                    "provider": "azure-ad",
-                    "refresh_token": getattr(self, "_refresh_token", None),
-                },
-            )
-            return (azure_user, user)
+        azure_user = await fetch_azure_user(self.http_client, token)
+
+        user = User(
+            identifier=azure_user["userPrincipalName"],
+            metadata={
+                "image": azure_user.get("image"),
+                "provider": "azure-ad",
+            },
+        )
+        store_user_tokens(user.identifier, self.id, token)
+        return (azure_user, user)
 
 
 class AzureADHybridOAuthProvider(OAuthProvider):
@@ -291,56 +490,34 @@ class AzureADHybridOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.token_url,
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            self.token_url,
+            data=payload,
+        )
+        response.raise_for_status()
+        json = response.json()
+
+        token = json["access_token"]
+        if not token:
+            raise HTTPException(
+                status_code=400, detail="Failed to get the access token"
             )
-            response.raise_for_status()
-            json = response.json()
-
-            token = json["access_token"]
-            refresh_token = json.get("refresh_token")
-            if not token:
-                raise HTTPException(
-                    status_code=400, detail="Failed to get the access token"
-                )
-            self._refresh_token = refresh_token
-            return token
+        remember_token_response(token, json)
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://graph.microsoft.com/v1.0/me",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-
-            azure_user = response.json()
-
-            try:
-                photo_response = await client.get(
-                    "https://graph.microsoft.com/v1.0/me/photos/48x48/$value",
-                    headers={"Authorization": f"Bearer {token}"},
-                )
-                photo_data = await photo_response.aread()
-                base64_image = base64.b64encode(photo_data)
-                azure_user["image"] = (
-                    f"data:{photo_response.headers['Content-Type']};base64,{base64_image.decode('utf-8')}"
-                )
-            except Exception:
-                # Ignore errors getting the photo
-                pass
-
-            user = User(
-                identifier=azure_user["userPrincipalName"],
-                metadata={
-                    "image": azure_user.get("image"),
-                    "provider": "azure-ad",
-                    "refresh_token": getattr(self, "_refresh_token", None),
-                },
-            )
-            return (azure_user, user)
+        azure_user = await fetch_azure_user(self.http_client, token)
+
+        user = User(
+            identifier=azure_user["userPrincipalName"],
+            metadata={
+                "image": azure_user.get("image"),
+                "provider": "azure-ad",
+            },
+        )
+        store_user_tokens(user.identifier, self.id, token)
+        return (azure_user, user)
 
 
 class OktaOAuthProvider(OAuthProvider):
@@ -386,37 +563,37 @@ class OktaOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.domain}/oauth2{self.get_authorization_server_path()}/v1/token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            f"{self.domain}/oauth2{self.get_authorization_server_path()}/v1/token",
+            data=payload,
+        )
+        response.raise_for_status()
+        json_data = response.json()
+
+        token = json_data.get("access_token")
+        if not token:
+            raise httpx.HTTPStatusError(
+                "Failed to get the access token",
+                request=response.request,
+                response=response,
             )
-            response.raise_for_status()
-            json_data = response.json()
-
-            token = json_data.get("access_token")
-            if not token:
-                raise httpx.HTTPStatusError(
-                    "Failed to get the access token",
-                    request=response.request,
-                    response=response,
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.domain}/oauth2{self.get_authorization_server_path()}/v1/userinfo",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-            okta_user = response.json()
+        client = self.http_client
+        response = await client.get(
+            f"{self.domain}/oauth2{self.get_authorization_server_path()}/v1/userinfo",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        okta_user = response.json()
 
-            user = User(
-                identifier=okta_user.get("email"),
-                metadata={"image": "", "provider": "okta"},
-            )
-            return (okta_user, user)
+        user = User(
+            identifier=okta_user.get("email"),
+            metadata={"image": "", "provider": "okta"},
+        )
+        return (okta_user, user)
 
 
 class Auth0OAuthProvider(OAuthProvider):
@@ -453,36 +630,36 @@ class Auth0OAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.domain}/oauth/token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            f"{self.domain}/oauth/token",
+            data=payload,
+        )
+        response.raise_for_status()
+        json_content = response.json()
+        token = json_content.get("access_token")
+        if not token:
+            raise HTTPException(
+                status_code=400, detail="Failed to get the access token"
             )
-            response.raise_for_status()
-            json_content = response.json()
-            token = json_content.get("access_token")
-            if not token:
-                raise HTTPException(
-                    status_code=400, detail="Failed to get the access token"
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.original_domain}/userinfo",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-            auth0_user = response.json()
-            user = User(
-                identifier=auth0_user.get("email"),
-                metadata={
-                    "image": auth0_user.get("picture", ""),
-                    "provider": "auth0",
-                },
-            )
-            return (auth0_user, user)
+        client = self.http_client
+        response = await client.get(
+            f"{self.original_domain}/userinfo",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        auth0_user = response.json()
+        user = User(
+            identifier=auth0_user.get("email"),
+            metadata={
+                "image": auth0_user.get("picture", ""),
+                "provider": "auth0",
+            },
+        )
+        return (auth0_user, user)
 
 
 class DescopeOAuthProvider(OAuthProvider):
@@ -513,35 +690,35 @@ class DescopeOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.domain}/token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            f"{self.domain}/token",
+            data=payload,
+        )
+        response.raise_for_status()
+        json_content = response.json()
+        token = json_content.get("access_token")
+        if not token:
+            raise httpx.HTTPStatusError(
+                "Failed to get the access token",
+                request=response.request,
+                response=response,
             )
-            response.raise_for_status()
-            json_content = response.json()
-            token = json_content.get("access_token")
-            if not token:
-                raise httpx.HTTPStatusError(
-                    "Failed to get the access token",
-                    request=response.request,
-                    response=response,
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.domain}/userinfo", headers={"Authorization": f"Bearer {token}"}
-            )
-            response.raise_for_status()  # This will raise an exception for 4xx/5xx responses
-            descope_user = response.json()
+        client = self.http_client
+        response = await client.get(
+            f"{self.domain}/userinfo", headers={"Authorization": f"Bearer {token}"}
+        )
+        response.raise_for_status()  # This will raise an exception for 4xx/5xx responses
+        descope_user = response.json()
 
-            user = User(
-                identifier=descope_user.get("email"),
-                metadata={"image": "", "provider": "descope"},
-            )
-            return (descope_user, user)
+        user = User(
+            identifier=descope_user.get("email"),
+            metadata={"image": "", "provider": "descope"},
+        )
+        return (descope_user, user)
 
 
 class AWSCognitoOAuthProvider(OAuthProvider):
@@ -574,43 +751,43 @@ class AWSCognitoOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                self.token_url,
-                data=payload,
-            )
-            response.raise_for_status()
-            json = response.json()
+        client = self.http_client
+        response = await client.post(
+            self.token_url,
+            data=payload,
+        )
+        response.raise_for_status()
+        json = response.json()
 
-            token = json.get("access_token")
-            if not token:
-                raise HTTPException(
-                    status_code=400, detail="Failed to get the access token"
-                )
-            return token
+        token = json.get("access_token")
+        if not token:
+            raise HTTPException(
+                status_code=400, detail="Failed to get the access token"
+            )
+        return token
 
     async def get_user_info(self, token: str):
         user_info_url = (
             f"https://{os.environ.get('OAUTH_COGNITO_DOMAIN')}/oauth2/userInfo"
         )
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                user_info_url,
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
+        client = self.http_client
+        response = await client.get(
+            user_info_url,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
 
-            cognito_user = response.json()
+        cognito_user = response.json()
 
-            # Customize user metadata as needed
-            user = User(
-                identifier=cognito_user["email"],
-                metadata={
-                    "image": cognito_user.get("picture", ""),
-                    "provider": "aws-cognito",
-                },
-            )
-            return (cognito_user, user)
+        # Customize user metadata as needed
+        user = User(
+            identifier=cognito_user["email"],
+            metadata={
+                "image": cognito_user.get("picture", ""),
+                "provider": "aws-cognito",
+            },
+        )
+        return (cognito_user, user)
 
 
 class GitlabOAuthProvider(OAuthProvider):
@@ -645,36 +822,36 @@ class GitlabOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.domain}/oauth/token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            f"{self.domain}/oauth/token",
+            data=payload,
+        )
+        response.raise_for_status()
+        json_content = response.json()
+        token = json_content.get("access_token")
+        if not token:
+            raise HTTPException(
+                status_code=400, detail="Failed to get the access token"
             )
-            response.raise_for_status()
-            json_content = response.json()
-            token = json_content.get("access_token")
-            if not token:
-                raise HTTPException(
-                    status_code=400, detail="Failed to get the access token"
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.domain}/oauth/userinfo",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-            gitlab_user = response.json()
-            user = User(
-                identifier=gitlab_user.get("email"),
-                metadata={
-                    "image": gitlab_user.get("picture", ""),
-                    "provider": "gitlab",
-                },
-            )
-            return (gitlab_user, user)
+        client = self.http_client
+        response = await client.get(
+            f"{self.domain}/oauth/userinfo",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        gitlab_user = response.json()
+        user = User(
+            identifier=gitlab_user.get("email"),
+            metadata={
+                "image": gitlab_user.get("picture", ""),
+                "provider": "gitlab",
+            },
+        )
+        return (gitlab_user, user)
 
 
 class KeycloakOAuthProvider(OAuthProvider):
@@ -711,35 +888,35 @@ class KeycloakOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{self.base_url}/realms/{self.realm}/protocol/openid-connect/token",
-                data=payload,
+        client = self.http_client
+        response = await client.post(
+            f"{self.base_url}/realms/{self.realm}/protocol/openid-connect/token",
+            data=payload,
+        )
+        response.raise_for_status()
+        json = response.json()
+        token = json.get("access_token")
+        if not token:
+            raise httpx.HTTPStatusError(
+                "Failed to get the access token",
+                request=response.request,
+                response=response,
             )
-            response.raise_for_status()
-            json = response.json()
-            token = json.get("access_token")
-            if not token:
-                raise httpx.HTTPStatusError(
-                    "Failed to get the access token",
-                    request=response.request,
-                    response=response,
-                )
-            return token
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/realms/{self.realm}/protocol/openid-connect/userinfo",
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-            kc_user = response.json()
-            user = User(
-                identifier=kc_user["email"],
-                metadata={"provider": "keycloak"},
-            )
-            return (kc_user, user)
+        client = self.http_client
+        response = await client.get(
+            f"{self.base_url}/realms/{self.realm}/protocol/openid-connect/userinfo",
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        kc_user = response.json()
+        user = User(
+            identifier=kc_user["email"],
+            metadata={"provider": "keycloak"},
+        )
+        return (kc_user, user)
 
 
 class GenericOAuthProvider(OAuthProvider):
@@ -778,57 +955,80 @@ class GenericOAuthProvider(OAuthProvider):
             "grant_type": "authorization_code",
             "redirect_uri": url,
         }
-        async with httpx.AsyncClient() as client:
-            response = await client.post(self.token_url, data=payload)
-            response.raise_for_status()
-            json = response.json()
-            token = json.get("access_token")
-            if not token:
-                raise httpx.HTTPStatusError(
-                    "Failed to get the access token",
-                    request=response.request,
-                    response=response,
-                )
-            return token
+        client = self.http_client
+        response = await client.post(self.token_url, data=payload)
+        response.raise_for_status()
+        json = response.json()
+        token = json.get("access_token")
+        if not token:
+            raise httpx.HTTPStatusError(
+                "Failed to get the access token",
+                request=response.request,
+                response=response,
+            )
+        return token
 
     async def get_user_info(self, token: str):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                self.user_info_url,
-                headers={"Authorization": f"Bearer {token}"},
-            )
-            response.raise_for_status()
-            server_user = response.json()
-            user = User(
-                identifier=server_user.get(self.user_identifier),
-                metadata={
-                    "provider": self.id,
-                },
-            )
-            return (server_user, user)
-
-
-providers = [
-    GithubOAuthProvider(),
-    GoogleOAuthProvider(),
-    AzureADOAuthProvider(),
-    AzureADHybridOAuthProvider(),
-    OktaOAuthProvider(),
-    Auth0OAuthProvider(),
-    DescopeOAuthProvider(),
-    AWSCognitoOAuthProvider(),
-    GitlabOAuthProvider(),
-    KeycloakOAuthProvider(),
-    GenericOAuthProvider(),
+        client = self.http_client
+        response = await client.get(
+            self.user_info_url,
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        response.raise_for_status()
+        server_user = response.json()
+        user = User(
+            identifier=server_user.get(self.user_identifier),
+            metadata={
+                "provider": self.id,
+            },
+        )
+        return (server_user, user)
+
+
+provider_classes: List[Type[OAuthProvider]] = [
+    GithubOAuthProvider,
+    GoogleOAuthProvider,
+    AzureADOAuthProvider,
+    AzureADHybridOAuthProvider,
+    OktaOAuthProvider,
+    Auth0OAuthProvider,
+    DescopeOAuthProvider,
+    AWSCognitoOAuthProvider,
+    GitlabOAuthProvider,
+    KeycloakOAuthProvider,
+    GenericOAuthProvider,
 ]
 
+_providers: Optional[Dict[str, OAuthProvider]] = None
+_configured_provider_ids: List[str] = []
+
+
+def _load_providers() -> Dict[str, OAuthProvider]:
+    """Instantiate the configured providers once, keyed by id."""
+    global _providers, _configured_provider_ids
+
+    if _providers is None:
+        _providers = {cls.id: cls() for cls in provider_classes if cls.is_configured()}
+        _configured_provider_ids = list(_providers)
+    return _providers
+
+
+def reload_oauth_providers() -> None:
+    """Forget the provider registry so the next lookup re-reads the environment.
+
+    Values some providers resolve at import time (tenant-specific Azure URLs,
+    Okta and Cognito domains, Keycloak and generic ids) are not refreshed.
+    """
+    global _providers, _configured_provider_ids
+
+    _providers = None
+    _configured_provider_ids = []
+
 
 def get_oauth_provider(provider: str) -> Optional[OAuthProvider]:
-    for p in providers:
-        if p.id == provider:
-            return p
-    return None
+    return _load_providers().get(provider)
 
 
 def get_configured_oauth_providers():
-    return [p.id for p in providers if p.is_configured()]
\ No newline at end of file
+    _load_providers()
+    return list(_configured_provider_ids)
@@ -0,0 +1,283 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCacheBackend:
+    """Per-process LRU store with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 512):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        # Expired entries stay until LRU eviction so they can still serve as a fallback
+        if expires_at < time.time() and not allow_stale:
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        self._entries[key] = (time.time() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Optional[str] = None) -> int:
+        if key is None:
+            count = len(self._entries)
+            self._entries.clear()
+            return count
+        return 1 if self._entries.pop(key, None) is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheBackend:
+    """Store shared by every worker on the host through a local SQLite file.
+
+    Every call may block on the disk or on another worker's write lock, so
+    ResponseCache runs them in a thread. A generation counter kept next to the
+    entries is bumped on every delete so other workers know to drop their
+    memory tier.
+    """
+
+    def __init__(self, path: str, max_entries: int = 512, trim_interval: float = 60, touch_interval: float = 60):
+        self.path = path
+        self.max_entries = max_entries
+        self.trim_interval = trim_interval
+        self.touch_interval = touch_interval
+        self._last_trim = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Connections must not be shared across fork, so open one per worker process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS response_cache_accessed_at ON response_cache (accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)"
+            )
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str, allow_stale: bool = False) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value, accessed_at FROM response_cache WHERE key = ? AND expires_at >= ?",
+                (key, float("-inf") if allow_stale else now),
+            ).fetchone()
+            if row is None:
+                return None
+            # LRU order only needs to be roughly right; don't turn every hit into a write
+            if row[1] < now - self.touch_interval:
+                self.conn.execute("UPDATE response_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        encoded = json.dumps(value)
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO response_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, encoded, now + ttl, now),
+            )
+            if now - self._last_trim > self.trim_interval:
+                self._trim(now, ttl)
+
+    def _trim(self, now: float, ttl: float) -> None:
+        self._last_trim = now
+        # Keep expired rows for one more TTL as stale fallbacks
+        self.conn.execute("DELETE FROM response_cache WHERE expires_at < ?", (now - ttl,))
+        self.conn.execute(
+            "DELETE FROM response_cache WHERE accessed_at < "
+            "(SELECT accessed_at FROM response_cache ORDER BY accessed_at DESC LIMIT 1 OFFSET ?)",
+            (self.max_entries - 1,),
+        )
+
+    def delete(self, key: Optional[str] = None) -> int:
+        with self._lock:
+            if key is None:
+                removed = self.conn.execute("DELETE FROM response_cache").rowcount
+            else:
+                removed = self.conn.execute("DELETE FROM response_cache WHERE key = ?", (key,)).rowcount
+            self.conn.execute(
+                "INSERT INTO response_cache_meta (name, value) VALUES ('generation', 1) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + 1"
+            )
+        return removed
+
+    def generation(self) -> int:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM response_cache_meta WHERE name = 'generation'").fetchone()
+        return row[0] if row else 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0]
+
+
+class ResponseCache:
+    """TTL + LRU cache of backend responses keyed on query and chat history.
+
+    Lookups hit the per-process memory store first and fall back to the
+    optional shared store, so workers benefit from each other's answers.
+    Shared-store calls run in a thread to keep SQLite off the event loop, and
+    the shared generation counter is polled every ``generation_interval``
+    seconds so an invalidation on one worker clears the memory tier of all.
+    """
+
+    def __init__(
+        self,
+        ttl: float = 600,
+        max_entries: int = 512,
+        shared: Optional[SQLiteCacheBackend] = None,
+        generation_interval: float = 1.0,
+    ):
+        self.ttl = ttl
+        self.local = MemoryCacheBackend(max_entries)
+        self.shared = shared
+        self.generation_interval = generation_interval
+        self._generation: Optional[int] = None
+        self._generation_checked = 0.0
+        # Called with the invalidated key, or None when everything was dropped
+        self.invalidation_listeners: List[Callable[[Optional[str]], None]] = []
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    @staticmethod
+    def history_fingerprint(chat_history: Optional[List[Dict[str, str]]]) -> str:
+        if not chat_history:
+            return ""
+        # ChatHistory windows are fingerprinted incrementally as turns are added
+        fingerprint = getattr(chat_history, "fingerprint", None)
+        if fingerprint is not None:
+            return fingerprint
+        encoded = json.dumps(chat_history, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def make_key(cls, query: str, chat_history: Optional[List[Dict[str, str]]] = None) -> str:
+        raw = f"{cls.normalize_query(query)}\x00{cls.history_fingerprint(chat_history)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _notify(self, key: Optional[str]) -> None:
+        for listener in self.invalidation_listeners:
+            listener(key)
+
+    async def check_generation(self) -> None:
+        now = time.monotonic()
+        if self.shared is None or now - self._generation_checked < self.generation_interval:
+            return
+        self._generation_checked = now
+        try:
+            generation = await asyncio.to_thread(self.shared.generation)
+        except sqlite3.Error as e:
+            logger.error(f"Shared cache read error: {str(e)}")
+            return
+        if self._generation is not None and generation != self._generation:
+            logger.info("Response cache invalidated by another worker, clearing the memory tier")
+            self.local.delete()
+            self._notify(None)
+        self._generation = generation
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        await self.check_generation()
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            try:
+                value = await asyncio.to_thread(self.shared.get, key)
+            except sqlite3.Error as e:
+                logger.error(f"Shared cache read error: {str(e)}")
+            if value is not None:
+                self.local.set(key, value, self.ttl)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def get_stale(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return an entry even past its TTL, for use when the backend is unavailable."""
+        await self.check_generation()
+        value = self.local.get(key, allow_stale=True)
+        if value is None and self.shared is not None:
+            try:
+                value = await asyncio.to_thread(self.shared.get, key, True)
+            except sqlite3.Error as e:
+                logger.error(f"Shared cache read error: {str(e)}")
+        if value is not None:
+            self.stale_hits += 1
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        if "error" in value:
+            return
+        self.local.set(key, value, self.ttl)
+        if self.shared is not None:
+            try:
+                await asyncio.to_thread(self.shared.set, key, value, self.ttl)
+            except sqlite3.Error as e:
+                logger.error(f"Shared cache write error: {str(e)}")
+
+    async def invalidate(self, key: Optional[str] = None) -> int:
+        removed = self.local.delete(key)
+        self._notify(key)
+        if self.shared is not None:
+            try:
+                removed = max(removed, await asyncio.to_thread(self.shared.delete, key))
+            except sqlite3.Error as e:
+                logger.error(f"Shared cache delete error: {str(e)}")
+            # Force the next lookup here to pick up the new generation too
+            self._generation_checked = 0.0
+        return removed
+
+    async def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        shared_entries = None
+        if self.shared is not None:
+            try:
+                shared_entries = await asyncio.to_thread(len, self.shared)
+            except sqlite3.Error as e:
+                logger.error(f"Shared cache read error: {str(e)}")
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "stale_hits": self.stale_hits,
+            "local_entries": len(self.local),
+            "shared_entries": shared_entries,
+            "ttl": self.ttl,
+        }
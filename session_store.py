@@ -0,0 +1,187 @@
+import base64
+import hashlib
+import hmac
+from http.cookies import SimpleCookie
+import json
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SESSION_COOKIE = "aidw_session"
+
+
+class MemorySessionStore:
+    """Per-process LRU store with per-entry expiry; only safe with a single worker."""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        # Calls arrive from the app's worker threads, like the SQLite store's
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            value = self.get(key)
+            self._entries.pop(key, None)
+            return value
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge_expired(self) -> int:
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._entries.items() if expires_at < now]
+            for key in expired:
+                del self._entries[key]
+        return len(expired)
+
+
+class SQLiteSessionStore:
+    """Store shared by every worker on the host through a local SQLite file.
+
+    Calls can block on another worker's write lock for up to the busy
+    timeout, so the app runs them in a thread; a lock serializes the threads
+    sharing this process's connection.
+    """
+
+    def __init__(self, path: str, purge_interval: float = 60):
+        self.path = path
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # Connections must not be shared across fork, so open one per worker process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM sessions WHERE key = ? AND expires_at >= ?", (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict[str, Any], ttl: float) -> None:
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO sessions (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl),
+            )
+            if now - self._last_purge > self.purge_interval:
+                self._purge_expired()
+
+    def pop(self, key: str) -> Optional[Dict[str, Any]]:
+        # Read and delete in one write transaction, so a PKCE verifier can only
+        # ever be redeemed by one callback
+        with self._lock:
+            conn = self.conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute("SELECT value, expires_at FROM sessions WHERE key = ?", (key,)).fetchone()
+                conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+            finally:
+                conn.execute("COMMIT")
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self.conn.execute("DELETE FROM sessions WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            return self._purge_expired()
+
+    def _purge_expired(self) -> int:
+        self._last_purge = time.time()
+        return self.conn.execute("DELETE FROM sessions WHERE expires_at < ?", (self._last_purge,)).rowcount
+
+
+class SessionSigner:
+    """HMAC-signs opaque ids so cookies and OAuth state cannot be forged."""
+
+    def __init__(self, secret: Optional[str]):
+        # A per-process random key would reject cookies signed by other workers
+        if not secret:
+            raise ValueError("SESSION_SECRET or CHAINLIT_AUTH_SECRET environment variable is not set")
+        self._key = secret.encode("utf-8")
+
+    def _signature(self, value: str) -> str:
+        digest = hmac.new(self._key, value.encode("utf-8"), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+    def sign(self, value: str) -> str:
+        return f"{value}.{self._signature(value)}"
+
+    def unsign(self, signed: Optional[str]) -> Optional[str]:
+        if not signed or "." not in signed:
+            return None
+        value, signature = signed.rsplit(".", 1)
+        if not hmac.compare_digest(signature, self._signature(value)):
+            return None
+        return value
+
+
+def cookie_from_header(header: Optional[str], name: str = SESSION_COOKIE) -> Optional[str]:
+    """Pull one cookie out of a raw Cookie header, as kept on Chainlit sessions."""
+    if not header:
+        return None
+    cookie = SimpleCookie()
+    try:
+        cookie.load(header)
+    except Exception:
+        return None
+    morsel = cookie.get(name)
+    return morsel.value if morsel else None
+
+
+def new_session_id() -> str:
+    return secrets.token_urlsafe(24)
+
+
+def build_session_store(backend: str, path: str):
+    if backend == "memory":
+        return MemorySessionStore()
+    return SQLiteSessionStore(path)
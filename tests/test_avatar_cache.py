@@ -0,0 +1,51 @@
+"""Graph throttling or outages during photo revalidation keep the cached avatar."""
+
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx  # noqa: E402
+import pytest  # noqa: E402
+
+import oauth_providers  # noqa: E402
+from oauth_providers import AvatarCache, fetch_azure_photo  # noqa: E402
+
+STALE_IMAGE = "data:image/jpeg;base64,c3RhbGU="
+
+
+def revalidate(monkeypatch, status_code: int):
+    cache = AvatarCache(ttl=0)
+    cache.set("tenant.user", '"v1"', STALE_IMAGE)
+    monkeypatch.setattr(oauth_providers, "avatar_cache", cache)
+    seen = []
+
+    def graph(request: httpx.Request) -> httpx.Response:
+        seen.append(request.headers.get("If-None-Match"))
+        return httpx.Response(status_code)
+
+    async def scenario():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(graph)) as client:
+            return await fetch_azure_photo(client, "token", "tenant.user", '"v1"')
+
+    image = asyncio.run(scenario())
+    assert seen == ['"v1"']
+    return image, cache
+
+
+@pytest.mark.parametrize("status_code", [429, 503])
+def test_transient_error_keeps_stale_photo(monkeypatch, status_code):
+    image, cache = revalidate(monkeypatch, status_code)
+
+    assert image == STALE_IMAGE
+    # Still stale, so the next login revalidates again
+    assert cache.get("tenant.user") == (False, '"v1"', STALE_IMAGE)
+
+
+def test_missing_photo_is_cached(monkeypatch):
+    image, cache = revalidate(monkeypatch, 404)
+
+    assert image is None
+    assert cache.get("tenant.user")[1:] == (None, None)
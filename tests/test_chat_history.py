@@ -0,0 +1,26 @@
+"""A failing summarizer falls back to dropping the oldest turns."""
+
+import asyncio
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from chat_history import ChatHistory  # noqa: E402
+
+
+def test_summarizer_error_truncates_instead_of_raising(caplog):
+    async def broken_summarizer(messages):
+        raise RuntimeError("summarizer unavailable")
+
+    history = ChatHistory(token_budget=200, summarizer=broken_summarizer)
+    for i in range(10):
+        history.add_turn(f"question {i} " * 10, f"answer {i} " * 10, f"answer {i}")
+
+    asyncio.run(history.compact())
+
+    assert 0 < len(history) < 20
+    assert history.turns[-1]["content"] == "answer 9 " * 10
+    assert history.summary is None
+    assert "summarizer unavailable" in caplog.text
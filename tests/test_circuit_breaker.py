@@ -0,0 +1,72 @@
+"""Only backend failures trip the circuit, and its state is visible on /metrics."""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.update({
+    "API_CLIENT_URL": "http://backend.test/query",
+    "REDIRECT_PATH": "/auth/callback",
+    "SESSION_STORE": "memory",
+    "SESSION_SECRET": "test-secret",
+    "RESPONSE_CACHE_ENABLED": "false",
+    "LOG_FILE": os.path.join(tempfile.mkdtemp(), "test.log"),
+})
+
+import httpx  # noqa: E402
+
+import app  # noqa: E402
+from admission import AdmissionController  # noqa: E402
+from circuit_breaker import OPEN, CircuitBreaker  # noqa: E402
+from metrics import MetricsRegistry  # noqa: E402
+
+
+def stream_once(status_code: int) -> CircuitBreaker:
+    breaker = CircuitBreaker(min_calls=1)
+    client = app.APIClient("http://backend.test/query", circuit_breaker=breaker, admission=AdmissionController())
+
+    async def scenario():
+        client._client = httpx.AsyncClient(
+            transport=httpx.MockTransport(lambda request: httpx.Response(status_code, json={"detail": "nope"}))
+        )
+        events = [event async for event in client.stream_request("How is AIDW used?")]
+        await client.aclose()
+        return events
+
+    events = asyncio.run(scenario())
+    assert events[-1][0] == "response" and "error" in events[-1][1]
+    return breaker
+
+
+def test_stream_client_error_does_not_trip_circuit():
+    breaker = stream_once(422)
+
+    assert breaker.stats()["window_failures"] == 0
+    assert not breaker.is_open
+
+
+def test_stream_server_error_trips_circuit():
+    breaker = stream_once(503)
+
+    assert breaker.state == OPEN
+
+
+def test_rejections_and_state_are_exported():
+    breaker = CircuitBreaker(min_calls=1)
+    registry = MetricsRegistry()
+    registry.register(breaker.rejections)
+    registry.register(breaker.state_gauge)
+
+    breaker.record_failure()
+    assert not breaker.allow_request()
+    breaker.reject()
+
+    text = registry.render()
+    assert "aidw_circuit_rejections_total 2" in text
+    assert 'aidw_circuit_state{state="open"} 1' in text
+    assert 'aidw_circuit_state{state="closed"} 0' in text
+    assert breaker.stats()["rejected"] == 2
@@ -0,0 +1,78 @@
+"""A user disconnecting mid-answer aborts the backend request right away.
+
+Drives Chainlit's real socket disconnect handler against a session whose
+on_message handler is waiting on a backend that never answers.
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.environ.update({
+    "API_CLIENT_URL": "http://backend.test/query",
+    "REDIRECT_PATH": "/auth/callback",
+    "SESSION_STORE": "memory",
+    "SESSION_SECRET": "test-secret",
+    "RESPONSE_CACHE_ENABLED": "false",
+    "LOG_FILE": os.path.join(tempfile.mkdtemp(), "test.log"),
+})
+
+import chainlit as cl  # noqa: E402
+import httpx  # noqa: E402
+from chainlit.context import init_ws_context  # noqa: E402
+from chainlit.session import WebsocketSession  # noqa: E402
+from chainlit.socket import disconnect  # noqa: E402
+
+import app  # noqa: E402
+
+
+def test_disconnect_cancels_backend_request():
+    async def scenario():
+        backend_started = asyncio.Event()
+        backend_cancelled = asyncio.Event()
+
+        async def hanging_backend(request: httpx.Request) -> httpx.Response:
+            backend_started.set()
+            try:
+                await asyncio.sleep(3600)
+            except asyncio.CancelledError:
+                backend_cancelled.set()
+                raise
+            return httpx.Response(200, json={"answer": "too late"})
+
+        async def emit(*_args, **_kwargs):
+            return None
+
+        app.api_client._client = httpx.AsyncClient(transport=httpx.MockTransport(hanging_backend))
+        session = WebsocketSession(
+            id=str(uuid.uuid4()),
+            socket_id=f"test-{uuid.uuid4()}",
+            emit=emit,
+            emit_call=emit,
+            user_env={},
+            client_type="webapp",
+        )
+        init_ws_context(session)
+        cancels_before = app.DISCONNECT_CANCELS.values.get((), 0)
+        backend_cancels_before = app.api_client.cancelled_count
+
+        handler = asyncio.create_task(app.on_message(cl.Message(content="How is AIDW used?", type="user_message")))
+        session.current_task = handler
+        await asyncio.wait_for(backend_started.wait(), timeout=5)
+
+        await disconnect(session.socket_id)
+
+        await asyncio.wait_for(backend_cancelled.wait(), timeout=5)
+        await asyncio.wait({handler}, timeout=5)
+        assert handler.cancelled()
+        assert app.api_client.cancelled_count == backend_cancels_before + 1
+        assert app.DISCONNECT_CANCELS.values.get((), 0) == cancels_before + 1
+        session.delete()
+        await app.api_client.aclose()
+
+    asyncio.run(scenario())
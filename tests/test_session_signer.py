@@ -0,0 +1,24 @@
+"""Every worker must share one signing key, so a missing secret fails at startup."""
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pytest  # noqa: E402
+
+from session_store import SessionSigner  # noqa: E402
+
+
+@pytest.mark.parametrize("secret", [None, ""])
+def test_missing_secret_is_rejected(secret):
+    with pytest.raises(ValueError):
+        SessionSigner(secret)
+
+
+def test_workers_with_the_same_secret_accept_each_others_cookies():
+    signed = SessionSigner("shared").sign("session-id")
+
+    assert SessionSigner("shared").unsign(signed) == "session-id"
+    assert SessionSigner("other").unsign(signed) is None
@@ -0,0 +1,206 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class TokenSet:
+    provider_id: str
+    access_token: str
+    refresh_token: Optional[str]
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, provider_id: str, response: Dict[str, Any], previous: Optional["TokenSet"] = None) -> "TokenSet":
+        # Identity providers may omit the refresh token when it is not rotated
+        refresh_token = response.get("refresh_token") or (previous.refresh_token if previous else None)
+        return cls(
+            provider_id=provider_id,
+            access_token=response["access_token"],
+            refresh_token=refresh_token,
+            expires_at=time.time() + float(response.get("expires_in", 3600)),
+        )
+
+
+class TokenStore:
+    """Per-user OAuth tokens, keyed by the user identifier.
+
+    Entries expire ``max_age`` seconds after the user's last login, so the
+    refresher stops renewing tokens for people who no longer use the app;
+    beyond ``max_entries`` the least recently logged-in users are evicted.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_age: float = 86400):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._tokens: "OrderedDict[str, Tuple[float, TokenSet]]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[TokenSet]:
+        entry = self._tokens.get(user_id)
+        if entry is None:
+            return None
+        logged_in_at, tokens = entry
+        if logged_in_at < time.time() - self.max_age:
+            del self._tokens[user_id]
+            return None
+        return tokens
+
+    def set(self, user_id: str, tokens: TokenSet) -> None:
+        """Store the tokens from a fresh login."""
+        self._tokens[user_id] = (time.time(), tokens)
+        self._tokens.move_to_end(user_id)
+        while len(self._tokens) > self.max_entries:
+            self._tokens.popitem(last=False)
+
+    def replace(self, user_id: str, tokens: TokenSet) -> None:
+        """Store renewed tokens without extending the login, unless the user is gone."""
+        entry = self._tokens.get(user_id)
+        if entry is not None:
+            self._tokens[user_id] = (entry[0], tokens)
+
+    def remove(self, user_id: str) -> None:
+        self._tokens.pop(user_id, None)
+
+    def purge_expired(self) -> int:
+        cutoff = time.time() - self.max_age
+        expired = [user_id for user_id, (logged_in_at, _) in self._tokens.items() if logged_in_at < cutoff]
+        for user_id in expired:
+            del self._tokens[user_id]
+        return len(expired)
+
+    def expiring(self, within: float) -> Dict[str, TokenSet]:
+        self.purge_expired()
+        deadline = time.time() + within
+        return {
+            user_id: tokens
+            for user_id, (_, tokens) in self._tokens.items()
+            if tokens.refresh_token and tokens.expires_at <= deadline
+        }
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+
+def is_rejected_grant(error: Exception) -> bool:
+    """True when the identity provider refused the refresh token itself."""
+    if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code != 400:
+        return False
+    try:
+        return error.response.json().get("error", "invalid_grant") == "invalid_grant"
+    except ValueError:
+        return True
+
+
+token_store = TokenStore(
+    max_entries=int(os.getenv("TOKEN_STORE_MAX_ENTRIES", "10000")),
+    max_age=float(os.getenv("SESSION_TTL", "86400")),
+)
+
+
+class TokenRefresher:
+    """Renew access tokens shortly before they expire using the refresh-token grant.
+
+    Refreshes are single-flight per user: concurrent callers share one request
+    to the identity provider.
+    """
+
+    def __init__(
+        self,
+        store: TokenStore,
+        get_provider: Callable[[str], Any],
+        skew: float = 300,
+        interval: float = 60,
+        concurrency: int = 10,
+    ):
+        self.store = store
+        self.get_provider = get_provider
+        self.skew = skew
+        self.interval = interval
+        self.concurrency = concurrency
+        self.refreshed = 0
+        self.failed = 0
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def _refresh(self, user_id: str, tokens: TokenSet) -> Optional[TokenSet]:
+        provider = self.get_provider(tokens.provider_id)
+        if provider is None or not tokens.refresh_token:
+            return None
+        try:
+            response = await provider.refresh_access_token(tokens.refresh_token)
+        except Exception as e:
+            logger.error(f"Token refresh failed for {user_id}: {str(e)}")
+            self.failed += 1
+            # A rejected refresh token will not work next time either; anything
+            # else (timeouts, 5xx) is the IdP's problem and worth another try
+            if is_rejected_grant(e) and self.store.get(user_id) is tokens:
+                self.store.remove(user_id)
+            return None
+        renewed = TokenSet.from_response(tokens.provider_id, response, previous=tokens)
+        self.store.replace(user_id, renewed)
+        self.refreshed += 1
+        return renewed
+
+    async def refresh(self, user_id: str) -> Optional[TokenSet]:
+        inflight = self._inflight.get(user_id)
+        if inflight is None:
+            tokens = self.store.get(user_id)
+            if tokens is None:
+                return None
+            inflight = asyncio.create_task(self._refresh(user_id, tokens))
+            self._inflight[user_id] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return await asyncio.shield(inflight)
+
+    async def get_access_token(self, user_id: str) -> Optional[str]:
+        """Return a usable access token for the user, renewing it first if needed."""
+        tokens = self.store.get(user_id)
+        if tokens is None:
+            return None
+        if tokens.expires_at - self.skew <= time.time():
+            tokens = await self.refresh(user_id)
+        return tokens.access_token if tokens else None
+
+    async def refresh_expiring(self) -> None:
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def renew(user_id: str):
+            async with semaphore:
+                await self.refresh(user_id)
+
+        expiring = self.store.expiring(self.skew)
+        if expiring:
+            await asyncio.gather(*(renew(user_id) for user_id in expiring))
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.refresh_expiring()
+            except Exception as e:
+                logger.error(f"Token refresher error: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "users": len(self.store),
+            "refreshed": self.refreshed,
+            "failed": self.failed,
+            "inflight": len(self._inflight),
+        }
@@ -0,0 +1,117 @@
+import functools
+import logging
+import threading
+from typing import Dict, Optional, Sequence
+
+from opentelemetry import trace
+from opentelemetry.context import Context
+from opentelemetry.propagate import inject
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+logger = logging.getLogger(__name__)
+
+
+
+class ModuleTracer:
+    """The app's tracer: a no-op until setup_tracing installs a private provider.
+
+    The global tracer provider is left alone on purpose. Chainlit's telemetry
+    configures its own global provider and exporter, and our spans, sampling
+    and trace headers must not depend on it or leak into it.
+    """
+
+    def __init__(self):
+        self.tracer: trace.Tracer = trace.NoOpTracer()
+
+    def start_span(self, *args, **kwargs) -> trace.Span:
+        return self.tracer.start_span(*args, **kwargs)
+
+    def start_as_current_span(self, *args, **kwargs):
+        return self.tracer.start_as_current_span(*args, **kwargs)
+
+
+tracer = ModuleTracer()
+
+
+class JSONLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a local file, one JSON object per line."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        lines = "".join(span.to_json(indent=None) + "\n" for span in spans)
+        with self._lock:
+            try:
+                self._file.write(lines)
+                self._file.flush()
+            except (OSError, ValueError) as e:
+                logger.error(f"Span export failed: {str(e)}")
+                return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+def setup_tracing(
+    service_name: str,
+    sample_ratio: float = 0.01,
+    export_path: Optional[str] = None,
+    otlp_endpoint: Optional[str] = None,
+) -> Optional[TracerProvider]:
+    """Create the app's tracer provider, sampling ``sample_ratio`` of new traces.
+
+    Spans are exported off the event loop by a batch processor, either to a
+    JSON-lines file, an OTLP collector, or both. Unsampled requests only pay
+    for a non-recording span.
+    """
+    if not export_path and not otlp_endpoint:
+        return None
+
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": service_name}),
+        sampler=ParentBased(TraceIdRatioBased(sample_ratio)),
+    )
+    if export_path:
+        provider.add_span_processor(BatchSpanProcessor(JSONLinesSpanExporter(export_path)))
+    if otlp_endpoint:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=otlp_endpoint)))
+    tracer.tracer = provider.get_tracer("aidw")
+    return provider
+
+
+def trace_headers(span: Optional[trace.Span] = None) -> Dict[str, str]:
+    """W3C trace context headers for the current span, or for ``span`` if given."""
+    headers: Dict[str, str] = {}
+    inject(headers, context=trace.set_span_in_context(span) if span is not None else None)
+    return headers
+
+
+def traced(name: str, root: bool = False):
+    """Run an async function inside a span named ``name``.
+
+    A ``root`` span starts a new trace, so entry points are sampled by our own
+    ratio instead of inheriting a decision from a span Chainlit made current.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            span = tracer.start_span(name, context=Context() if root else None)
+            # use_span also makes a no-op span current, so a span started by
+            # Chainlit's own telemetry never picks up our attributes or headers
+            with trace.use_span(span, end_on_exit=True):
+                return await func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator